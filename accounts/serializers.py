@@ -9,6 +9,7 @@ from .models import PasswordResetCode
 from django.contrib.auth.password_validation import validate_password
 from .models import PasswordResetCode
 from .celery_task import Celery_send_mail
+from services.images import ImageDerivativesField
 
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
@@ -252,10 +253,11 @@ class userListSerializer(serializers.ModelSerializer):
 
 class UserUpdateSerializer(serializers.ModelSerializer):
     profile_image = serializers.ImageField(use_url=True, required=False)
+    profile_image_derivatives = ImageDerivativesField(source="profile_image")
 
     class Meta:
         model = User
-        fields = ['id', 'full_name', 'email', 'phone_number', 'profile_image', 'is_active']
+        fields = ['id', 'full_name', 'email', 'phone_number', 'profile_image', 'profile_image_derivatives', 'is_active']
         read_only_fields = ['id', 'is_active']
 
     def validate_email(self, value):
@@ -277,7 +279,9 @@ class UserActivateSerializer(serializers.ModelSerializer):
         fields = ['is_active']
 
 class CurrentUserSerializer(serializers.ModelSerializer):
+    profile_image_derivatives = ImageDerivativesField(source="profile_image")
+
     class Meta:
         model = User
-        fields = ['id', 'full_name', 'email', 'phone_number', 'profile_image', 'is_active', 'is_premium']
+        fields = ['id', 'full_name', 'email', 'phone_number', 'profile_image', 'profile_image_derivatives', 'is_active', 'is_premium']
         
\ No newline at end of file
@@ -152,6 +152,8 @@ class UserListView(generics.ListAPIView):
     permission_classes = [permissions.IsAdminUser]
     filter_backends = [filters.SearchFilter]
     search_fields = ['full_name', 'email', 'phone_number']
+    # users have no create_at, page by primary key
+    keyset_ordering = ('id',)
     
 
 class UserDetailsUpdateView(generics.RetrieveUpdateAPIView):
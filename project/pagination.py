@@ -0,0 +1,113 @@
+import base64
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Forward-only keyset (cursor) pagination.
+
+    Rows are ordered by the queryset's own ordering when it has one (e.g. a
+    distance sort) and by `view.keyset_ordering` or ("create_at", "id")
+    otherwise. The cursor holds the ordering values of the last row sent, so
+    every page is a `WHERE (a, b) > (x, y) ... LIMIT n` query: deep pages cost
+    the same as the first. Ordering fields must be model fields or annotations
+    on the rows themselves and end in a unique one (id).
+    """
+
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    ordering = ("create_at", "id")
+    max_page_size = 200
+
+    def get_page_size(self, request):
+        default = settings.REST_FRAMEWORK.get("PAGE_SIZE") or 50
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, default))
+        except (TypeError, ValueError):
+            size = default
+        return max(1, min(size, self.max_page_size))
+
+    def get_ordering(self, queryset, view):
+        order_by = queryset.query.order_by
+        if order_by and all(isinstance(field, str) for field in order_by):
+            return tuple(order_by)
+        return tuple(getattr(view, "keyset_ordering", self.ordering))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+        except (TypeError, ValueError):
+            raise NotFound("Invalid cursor")
+        if not isinstance(cursor, list):
+            raise NotFound("Invalid cursor")
+        return cursor
+
+    def encode_cursor(self, values):
+        return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode()
+
+    def after(self, ordering, values):
+        """Q for rows that come after `values` in `ordering`."""
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, values):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            condition |= equal & Q(**{f"{name}__{lookup}": value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering_fields = self.get_ordering(queryset, view)
+
+        queryset = queryset.order_by(*self.ordering_fields)
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            if len(cursor) != len(self.ordering_fields):
+                raise NotFound("Invalid cursor")
+            try:
+                queryset = queryset.filter(self.after(self.ordering_fields, cursor))
+            except (TypeError, ValueError, ValidationError):
+                # Values that do not fit the ordering fields, e.g. a number for create_at
+                raise NotFound("Invalid cursor")
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        values = [getattr(last, field.lstrip("-")) for field in self.ordering_fields]
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(values))
+
+    def get_paginated_response(self, data):
+        return Response({
+            "next": self.get_next_link(),
+            "results": data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
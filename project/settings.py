@@ -184,6 +184,17 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
+    'DEFAULT_RENDERER_CLASSES': (
+        'project.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'project.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+    'DEFAULT_PAGINATION_CLASS': 'project.pagination.KeysetPagination',
+    'PAGE_SIZE': int(os.getenv('API_PAGE_SIZE', '50')),
 }
 
 SIMPLE_JWT = {
@@ -295,9 +306,35 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 
+# Shared Redis cache when CACHE_URL is set (e.g. redis://localhost:6379/2), per-process memory otherwise
+CACHE_URL = os.getenv('CACHE_URL', '')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+# Seconds a cached catalog response lives; model changes invalidate it sooner (see services.cache)
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', '600'))
+
 USE_TZ = True
 TIME_ZONE = 'Asia/Dhaka'
 
+# Where nearest-venue lookups get their candidates: "grid" (in-memory index), "sql" (bounding-box
+# queries) or "rtree" (SQLite R*Tree tables, rebuilt with `manage.py rebuild_rtree`)
+SPATIAL_BACKEND = os.getenv('SPATIAL_BACKEND', 'grid')
+# Cell size (degrees) of the in-memory venue grid used by the nearest-venue endpoints
+VENUE_GRID_CELL_DEG = float(os.getenv('VENUE_GRID_CELL_DEG', '0.25'))
+# Cell size (degrees) of the grid holding geofence bounding boxes for geofences/check/
+GEOFENCE_GRID_CELL_DEG = float(os.getenv('GEOFENCE_GRID_CELL_DEG', '0.5'))
+
 
 
 # Import Jazzmin configuration from separate file
@@ -0,0 +1,79 @@
+"""
+Offline catalog bundle.
+
+The whole catalog (cities, place types, venues, stops, hunts, messages,
+attractions and geofences) serialized into one gzipped JSON file in media
+storage, so a fresh install downloads a single static file. The bundle
+carries a sync cursor; clients continue from it with the sync endpoint.
+"""
+import gzip
+import hashlib
+import logging
+import time
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import transaction
+
+from project.renderers import ORJSONRenderer
+
+from .models import CatalogBundle, City, GeoFenced, PlaceType
+
+logger = logging.getLogger(__name__)
+
+# Bundles kept in storage; clients may still be downloading older ones
+KEEP_BUNDLES = 3
+# Seconds to wait after a change before building, so a burst of edits
+# produces one bundle
+BUILD_DELAY = 60
+SCHEDULED_KEY = "catalog_bundle:scheduled"
+
+
+def catalog_payload():
+    from .serializers import CitySerializer, GeoFencedSerializer, PlaceTypeSerializer, SYNC_SERIALIZERS
+    from .sync import changes_since
+
+    changed, _, cursor = changes_since(None)
+    payload = {
+        "cursor": cursor,
+        "cities": CitySerializer(City.objects.order_by("id"), many=True).data,
+        "place_types": PlaceTypeSerializer(PlaceType.objects.order_by("id"), many=True).data,
+    }
+    for key, queryset in changed.items():
+        payload[key] = SYNC_SERIALIZERS[key](queryset, many=True).data
+    payload["geofences"] = GeoFencedSerializer(
+        GeoFenced.objects.prefetch_related("polygon_points").order_by("id"), many=True
+    ).data
+    return payload
+
+
+def build_bundle():
+    """Write a new bundle to storage and drop all but the newest KEEP_BUNDLES."""
+    body = gzip.compress(ORJSONRenderer().render(catalog_payload()), mtime=0)
+
+    last = CatalogBundle.objects.order_by("-version").values_list("version", flat=True).first() or 0
+    version = max(int(time.time() * 1000), last + 1)
+    bundle = CatalogBundle(version=version, size=len(body), sha256=hashlib.sha256(body).hexdigest())
+    bundle.file.save(f"catalog-{version}.json.gz", ContentFile(body), save=True)
+
+    for old in CatalogBundle.objects.order_by("-version")[KEEP_BUNDLES:]:
+        old.file.delete(save=False)
+        old.delete()
+    return bundle
+
+
+def schedule_bundle_build():
+    """Queue a rebuild once the current transaction commits, at most once per BUILD_DELAY."""
+    def enqueue():
+        if not cache.add(SCHEDULED_KEY, True, BUILD_DELAY):
+            return
+        from .tasks import build_catalog_bundle
+
+        try:
+            build_catalog_bundle.apply_async(countdown=BUILD_DELAY, retry=False)
+        except Exception:
+            # A missing broker must not fail the write that changed the catalog;
+            # the key stays set so the next attempt waits BUILD_DELAY
+            logger.warning("Could not queue the catalog bundle build", exc_info=True)
+
+    transaction.on_commit(enqueue)
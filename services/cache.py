@@ -0,0 +1,68 @@
+"""
+Response cache for the public catalog endpoints.
+
+A cached GET lists the models its payload is read from. Its cache key holds
+the current version of each of those models, and saving or deleting a row
+bumps the version of its model (see services.signals), so only endpoints
+reading that model miss on their next request. Versions are nanosecond
+timestamps, so one evicted from the cache never comes back as an old value.
+"""
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.response import Response
+
+
+def version_key(model):
+    return f"catalog:version:{model._meta.label_lower}"
+
+
+def model_versions(models):
+    keys = [version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def bump_version(model):
+    cache.set(version_key(model), time.time_ns(), None)
+    # Again once committed: a request may have cached the old rows meanwhile
+    transaction.on_commit(lambda: cache.set(version_key(model), time.time_ns(), None))
+
+
+def response_key(view, request, models):
+    versions = ":".join(str(version) for version in model_versions(models))
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f"catalog:response:{type(view).__name__}:{versions}:{path}"
+
+
+def cache_response(*models, anonymous_only=False):
+    """
+    Cache a view's GET response data per endpoint and query string.
+
+    `models` are the models the response is built from. With `anonymous_only`
+    (responses that carry per-user data) authenticated requests skip the cache.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            if anonymous_only and request.user.is_authenticated:
+                return method(view, request, *args, **kwargs)
+
+            key = response_key(view, request, models)
+            data = cache.get(key)
+            if data is not None:
+                return Response(data)
+            response = method(view, request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
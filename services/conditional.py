@@ -0,0 +1,87 @@
+"""
+Conditional GET for list endpoints.
+
+The validator of a list is (max update_at, row count, max id) of the rows it
+renders, plus the same figures for the related rows nested in it. Edits move
+update_at, inserts and deletes move the count, so one aggregate query is
+enough to answer If-None-Match before serializing.
+
+If-Modified-Since is not answered and no Last-Modified is sent: a date
+alone misses deletes, which leave max(update_at) where it was, and edits
+made within the same second as the previous fetch.
+"""
+import hashlib
+
+from django.db.models import Count, Max, Value
+from django.utils.cache import get_conditional_response
+
+
+def related_rows(queryset, relation):
+    """Rows of `relation` (a forward or reverse FK) linked to `queryset`."""
+    field = queryset.model._meta.get_field(relation)
+    return field.related_model._default_manager.filter(
+        **{f"{field.remote_field.name}__in": queryset.order_by().values("pk")}
+    )
+
+
+def summarize(querysets):
+    """(max update_at, count, max id) of each queryset, in one UNION ALL query."""
+    parts = [
+        queryset.order_by()
+        .annotate(_part=Value(i))
+        .values("_part")
+        .annotate(updated=Max("update_at"), count=Count("pk"), last=Max("pk"))
+        .values_list("_part", "updated", "count", "last")
+        for i, queryset in enumerate(querysets)
+    ]
+    rows = parts[0].union(*parts[1:], all=True) if len(parts) > 1 else parts[0]
+    return [row[1:] for row in sorted(rows, key=lambda row: row[0])]
+
+
+class NotModified(Exception):
+    def __init__(self, response):
+        self.response = response
+
+
+class ConditionalGetMixin:
+    """
+    Answers If-None-Match with 304 right after authentication and sets the
+    ETag on full responses.
+
+    `conditional_related` names the relations whose rows are rendered with
+    each object. The ETag is weak because the browsable API and JSON
+    renderings of the same data differ byte for byte.
+    """
+    conditional_related = ()
+
+    def get_conditional_related(self):
+        return self.conditional_related
+
+    def get_conditional_querysets(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        return [queryset, *(related_rows(queryset, relation) for relation in self.get_conditional_related())]
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.etag = None
+        if request.method not in ("GET", "HEAD"):
+            return
+
+        summaries = summarize(self.get_conditional_querysets())
+        digest = hashlib.md5(repr(summaries).encode()).hexdigest()
+        self.etag = f'W/"{digest}"'
+
+        response = get_conditional_response(request, etag=self.etag)
+        if response is not None:
+            raise NotModified(response)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, "etag", None) and response.status_code in (200, 304):
+            response["ETag"] = self.etag
+        return response
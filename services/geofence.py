@@ -0,0 +1,317 @@
+import gzip
+import math
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+def points_in_polygon(lats, lons, poly_lats, poly_lons):
+    """
+    Even-odd ray casting of many points against one polygon.
+
+    Returns a boolean array with one entry per point. The polygon is the
+    closed ring through its vertices in order; x is longitude, y latitude.
+    """
+    y = np.asarray(lats, dtype=np.float64)[:, None]
+    x = np.asarray(lons, dtype=np.float64)[:, None]
+    yi = np.asarray(poly_lats, dtype=np.float64)
+    xi = np.asarray(poly_lons, dtype=np.float64)
+    yj = np.roll(yi, 1)
+    xj = np.roll(xi, 1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crosses = ((yi > y) != (yj > y)) & (x < (xj - xi) * (y - yi) / (yj - yi) + xi)
+    return np.count_nonzero(crosses, axis=1) % 2 == 1
+
+
+def pack_polygon(lats, lons):
+    """Pack polygon vertices into the bytes stored in GeoFenced.polygon."""
+    points = np.column_stack([np.asarray(lats, dtype="<f8"), np.asarray(lons, dtype="<f8")])
+    return points.tobytes()
+
+
+def unpack_polygon(data):
+    """Inverse of pack_polygon; returns (latitudes, longitudes) arrays."""
+    points = np.frombuffer(bytes(data), dtype="<f8").reshape(-1, 2)
+    return points[:, 0], points[:, 1]
+
+
+def polygon_of(fence):
+    """
+    (latitudes, longitudes) of a fence, read from the packed column or, for
+    fences not yet packed by `manage.py pack_geofence_polygons`, from their
+    LatLng rows (prefetch "polygon_points" to avoid a query per fence).
+    """
+    if fence.polygon:
+        return unpack_polygon(fence.polygon)
+    points = sorted(fence.polygon_points.all(), key=lambda p: p.id)
+    return (
+        np.array([p.latitude for p in points], dtype=np.float64),
+        np.array([p.longitude for p in points], dtype=np.float64),
+    )
+
+
+# Douglas-Peucker tolerance in degrees for each ?precision= level of the
+# geofence list; "full" is the stored polygon. 0.0001 deg is roughly 11 m.
+PRECISION_LEVELS = {
+    "medium": 0.0001,
+    "low": 0.001,
+}
+
+
+def simplify_polygon(lats, lons, tolerance):
+    """
+    Douglas-Peucker simplification of a closed polygon ring.
+
+    The ring is split at its first vertex and the vertex farthest from it and
+    each half is simplified on its own. Polygons that would drop below 4
+    vertices are returned unchanged.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    n = len(lats)
+    if n <= 4 or tolerance <= 0:
+        return lats, lons
+
+    ring = np.column_stack([lons, lats])
+    ring = np.vstack([ring, ring[:1]])
+    keep = np.zeros(n + 1, dtype=bool)
+    far = int(np.argmax(((ring[:n] - ring[0]) ** 2).sum(axis=1)))
+    keep[[0, far, n]] = True
+
+    stack = [(0, far), (far, n)]
+    while stack:
+        i, j = stack.pop()
+        if j - i < 2:
+            continue
+        start, end = ring[i], ring[j]
+        chain = ring[i + 1:j] - start
+        direction = end - start
+        length = np.hypot(*direction)
+        if length:
+            distances = np.abs(direction[0] * chain[:, 1] - direction[1] * chain[:, 0]) / length
+        else:
+            distances = np.hypot(chain[:, 0], chain[:, 1])
+        k = int(np.argmax(distances))
+        if distances[k] > tolerance:
+            keep[i + 1 + k] = True
+            stack += [(i, i + 1 + k), (i + 1 + k, j)]
+
+    keep = keep[:n]
+    if np.count_nonzero(keep) < 4:
+        return lats, lons
+    return lats[keep], lons[keep]
+
+
+def refresh_simplified(fence):
+    """Recompute fence.simplified from its polygon; the caller saves the fence."""
+    lats, lons = polygon_of(fence)
+    fence.simplified = {}
+    for level, tolerance in PRECISION_LEVELS.items():
+        level_lats, level_lons = simplify_polygon(lats, lons, tolerance)
+        fence.simplified[level] = [[lat, lon] for lat, lon in zip(level_lats.tolist(), level_lons.tolist())]
+
+
+class GeofenceIndex:
+    """
+    Geofence polygons with precomputed bounding boxes.
+
+    Boxes are registered in every cell of a uniform lat/lon grid they overlap,
+    so a lookup only ray-casts the fences whose box contains the point. Fences
+    whose box spans more than `max_cells` cells are kept in a short list that
+    is always checked instead of being spread over the grid.
+    """
+
+    def __init__(self, fences, cell_deg=0.5, max_cells=4096):
+        self.cell_deg = cell_deg
+        self.fences = {}
+        self.cells = defaultdict(list)
+        self.large = []
+
+        for fence, lats, lons in fences:
+            lats = np.asarray(lats, dtype=np.float64)
+            lons = np.asarray(lons, dtype=np.float64)
+            if len(lats) < 3:
+                continue
+            bbox = (lats.min(), lats.max(), lons.min(), lons.max())
+            self.fences[fence.id] = (fence, lats, lons, bbox)
+
+            rows = range(self._row(bbox[0]), self._row(bbox[1]) + 1)
+            cols = range(self._col(bbox[2]), self._col(bbox[3]) + 1)
+            if len(rows) * len(cols) > max_cells:
+                self.large.append(fence.id)
+                continue
+            for row in rows:
+                for col in cols:
+                    self.cells[row, col].append(fence.id)
+
+    def _row(self, lat):
+        return int(math.floor(lat / self.cell_deg))
+
+    def _col(self, lon):
+        return int(math.floor(lon / self.cell_deg))
+
+    def candidates(self, lat, lon):
+        """Ids of fences whose bounding box contains the point."""
+        ids = self.cells.get((self._row(lat), self._col(lon)), []) + self.large
+        result = []
+        for fence_id in ids:
+            min_lat, max_lat, min_lon, max_lon = self.fences[fence_id][3]
+            if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon:
+                result.append(fence_id)
+        return result
+
+    def membership(self, lats, lons):
+        """
+        Evaluate many points against every fence at once.
+
+        Returns (fence_ids, inside) where inside[i, j] tells whether point i
+        lies in fence_ids[j]. Points are ray-cast only against fences whose
+        bounding box holds them.
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        fence_ids = list(self.fences)
+        inside = np.zeros((len(lats), len(fence_ids)), dtype=bool)
+        if not len(lats) or not fence_ids:
+            return fence_ids, inside
+
+        bboxes = np.array([self.fences[fence_id][3] for fence_id in fence_ids])
+        in_bbox = (
+            (lats[:, None] >= bboxes[:, 0]) & (lats[:, None] <= bboxes[:, 1])
+            & (lons[:, None] >= bboxes[:, 2]) & (lons[:, None] <= bboxes[:, 3])
+        )
+        for j in np.flatnonzero(in_bbox.any(axis=0)):
+            _, poly_lats, poly_lons, _ = self.fences[fence_ids[j]]
+            rows = np.flatnonzero(in_bbox[:, j])
+            inside[rows, j] = points_in_polygon(lats[rows], lons[rows], poly_lats, poly_lons)
+        return fence_ids, inside
+
+    def transitions(self, lats, lons, initial=()):
+        """
+        Enter/exit events along an ordered track of points.
+
+        `initial` holds the ids of the fences the track starts inside. Returns
+        (events, final) where events is a list of (point_index, fence, "enter"
+        or "exit") and final is the set of fence ids the track ends inside.
+        """
+        initial = set(initial)
+        fence_ids, inside = self.membership(lats, lons)
+        start = np.array([fence_id in initial for fence_id in fence_ids], dtype=bool)
+        states = np.vstack([start[None, :], inside])
+        changed = np.argwhere(states[1:] != states[:-1])
+
+        events = [
+            (int(i), self.fences[fence_ids[j]][0], "enter" if inside[i, j] else "exit")
+            for i, j in changed
+        ]
+        final = {fence_ids[j] for j in np.flatnonzero(states[-1])}
+        return events, final
+
+    def containing(self, lat, lon):
+        """GeoFenced instances whose polygon contains (lat, lon)."""
+        matches = []
+        for fence_id in self.candidates(lat, lon):
+            fence, lats, lons, _ = self.fences[fence_id]
+            if points_in_polygon([lat], [lon], lats, lons)[0]:
+                matches.append(fence)
+        return matches
+
+
+_geofence_index = None
+_geofence_index_version = None
+_geofence_index_lock = threading.Lock()
+
+# Shared stamp of the fences, moved by every fence or vertex write; each
+# process rebuilds its index once it changes (the cache must be shared)
+GEOFENCE_INDEX_VERSION_KEY = "geofence_index:version"
+
+
+def load_polygons():
+    """Yield (fence, latitudes, longitudes) for every GeoFenced row."""
+    from .models import GeoFenced
+
+    for fence in GeoFenced.objects.prefetch_related("polygon_points"):
+        lats, lons = polygon_of(fence)
+        yield fence, lats, lons
+
+
+def geofence_index_version():
+    version = cache.get(GEOFENCE_INDEX_VERSION_KEY)
+    if version is None:
+        cache.add(GEOFENCE_INDEX_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(GEOFENCE_INDEX_VERSION_KEY)
+    return version
+
+
+def get_geofence_index():
+    """Return the process-local geofence index, rebuilt whenever the shared version moves."""
+    global _geofence_index, _geofence_index_version
+    # Read before the fences, so a write landing during the build bumps it past this value
+    version = geofence_index_version()
+    index = _geofence_index
+    if index is None or _geofence_index_version != version:
+        with _geofence_index_lock:
+            if _geofence_index is None or _geofence_index_version != version:
+                _geofence_index = GeofenceIndex(
+                    load_polygons(),
+                    cell_deg=getattr(settings, "GEOFENCE_GRID_CELL_DEG", 0.5),
+                )
+                _geofence_index_version = version
+            index = _geofence_index
+    return index
+
+
+def invalidate_geofence_index():
+    global _geofence_index
+    with _geofence_index_lock:
+        _geofence_index = None
+    cache.set(GEOFENCE_INDEX_VERSION_KEY, time.time_ns(), None)
+    # Again once committed: another process may have rebuilt from the old rows meanwhile
+    transaction.on_commit(lambda: cache.set(GEOFENCE_INDEX_VERSION_KEY, time.time_ns(), None))
+
+
+SNAPSHOT_CACHE_KEY = "geofence_snapshot"
+SNAPSHOT_VERSION_KEY = "geofence_snapshot:version"
+
+
+def build_snapshot():
+    """
+    Serialize every fence once per precision level, gzip each payload and
+    store them in the cache under a new version.
+
+    Versions are millisecond timestamps bumped past the last one handed out,
+    so they only ever increase. The cache must be shared (e.g. Redis) for all
+    workers to see the same snapshot.
+    """
+    from project.renderers import ORJSONRenderer
+
+    from .models import GeoFenced
+    from .serializers import GeoFencedSerializer
+
+    fences = list(GeoFenced.objects.prefetch_related("polygon_points"))
+    payloads = {}
+    for level in ["full", *PRECISION_LEVELS]:
+        data = GeoFencedSerializer(fences, many=True, context={"precision": level}).data
+        payloads[level] = gzip.compress(ORJSONRenderer().render(data), mtime=0)
+
+    version = max(int(time.time() * 1000), (cache.get(SNAPSHOT_VERSION_KEY) or 0) + 1)
+    snapshot = {"version": version, "payloads": payloads}
+    cache.set(SNAPSHOT_VERSION_KEY, version, None)
+    cache.set(SNAPSHOT_CACHE_KEY, snapshot, None)
+    return snapshot
+
+
+def get_snapshot():
+    """The current geofence snapshot, built on first use after a change."""
+    return cache.get(SNAPSHOT_CACHE_KEY) or build_snapshot()
+
+
+def expire_snapshot():
+    # Wait for the write to commit so the rebuild cannot read the old rows
+    transaction.on_commit(lambda: cache.delete(SNAPSHOT_CACHE_KEY))
@@ -0,0 +1,146 @@
+"""
+Downscaled derivatives of uploaded images.
+
+After an image is uploaded a Celery task writes a WebP and a JPEG copy of
+it at every DERIVATIVE_SIZES size next to the original, under
+<upload dir>/derivatives/. Derivative names follow from the original's
+name alone, so serializers link them without a query; until the task has
+run (usually seconds after the upload) the links may 404 and clients
+should fall back to the original.
+"""
+import io
+import logging
+import posixpath
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+from rest_framework import serializers
+
+from .models import NearByAttraction, ScavengerHunt, UserScavengerHunt, Venue
+
+logger = logging.getLogger(__name__)
+
+# name: (width, height, crop). Cropped derivatives have exactly that aspect
+# ratio, the others fit inside the box; images are never upscaled.
+DERIVATIVE_SIZES = {
+    "thumb": (320, 320, True),
+    "medium": (1024, 1024, False),
+}
+
+# format (also the file extension): Pillow format and save options
+DERIVATIVE_FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+# Image fields that get derivatives, per model
+IMAGE_FIELDS = {
+    Venue: ("image",),
+    ScavengerHunt: ("image",),
+    NearByAttraction: ("image",),
+    UserScavengerHunt: ("uploaded_image",),
+    get_user_model(): ("profile_image",),
+}
+
+
+def derivative_name(name, size, image_format):
+    directory, filename = posixpath.split(name)
+    return posixpath.join(directory, "derivatives", f"{filename}.{size}.{image_format}")
+
+
+def resize(image, width, height, crop):
+    if crop:
+        # Crop to the box's aspect ratio at no more than the image's own scale
+        scale = min(1, image.width / width, image.height / height)
+        return ImageOps.fit(image, (max(1, round(width * scale)), max(1, round(height * scale))), Image.LANCZOS)
+    image = image.copy()
+    image.thumbnail((width, height), Image.LANCZOS)
+    return image
+
+
+def encode(image, image_format):
+    pillow_format, options = DERIVATIVE_FORMATS[image_format]
+    if pillow_format == "JPEG" and image.mode == "RGBA":
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    body = io.BytesIO()
+    image.save(body, pillow_format, **options)
+    return body.getvalue()
+
+
+def build_derivatives(name, storage=default_storage):
+    """Write the missing derivatives of the stored image `name`; returns the names written."""
+    missing = [
+        (size, image_format)
+        for size in DERIVATIVE_SIZES
+        for image_format in DERIVATIVE_FORMATS
+        if not storage.exists(derivative_name(name, size, image_format))
+    ]
+    if not missing:
+        return []
+
+    try:
+        with storage.open(name, "rb") as file:
+            image = Image.open(file)
+            # Lets JPEGs decode at a fraction of their size
+            largest = max(max(width, height) for width, height, _ in DERIVATIVE_SIZES.values())
+            image.draft("RGB", (largest, largest))
+            image = ImageOps.exif_transpose(image)
+            has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+            image = image.convert("RGBA" if has_alpha else "RGB")
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+        logger.warning("Could not read image %s for derivatives", name, exc_info=True)
+        return []
+
+    written, resized = [], {}
+    for size, image_format in missing:
+        if size not in resized:
+            resized[size] = resize(image, *DERIVATIVE_SIZES[size])
+        target = derivative_name(name, size, image_format)
+        written.append(storage.save(target, ContentFile(encode(resized[size], image_format))))
+    return written
+
+
+def schedule_derivatives(names):
+    """Queue derivative builds for stored images once the current transaction commits."""
+    names = [name for name in names if name]
+    if not names:
+        return
+
+    def enqueue():
+        from .tasks import build_image_derivatives
+
+        try:
+            build_image_derivatives.apply_async((names,), retry=False)
+        except Exception:
+            # The upload itself succeeded; rebuild later with build_image_derivatives
+            logger.warning("Could not queue image derivatives for %s", names, exc_info=True)
+
+    transaction.on_commit(enqueue)
+
+
+class ImageDerivativesField(serializers.Field):
+    """
+    Read-only URLs of an image field's derivatives as {size: {format: url}},
+    None without an image. Use with source=<image field>.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        request = self.context.get("request")
+        urls = {}
+        for size in DERIVATIVE_SIZES:
+            urls[size] = {}
+            for image_format in DERIVATIVE_FORMATS:
+                url = value.storage.url(derivative_name(value.name, size, image_format))
+                urls[size][image_format] = request.build_absolute_uri(url) if request is not None else url
+        return urls
@@ -0,0 +1,281 @@
+"""
+Bulk catalog import.
+
+Venues, stops, scavenger hunts and messages are read from a CSV file or
+GeoJSON features, one record per row, and upserted in batches. Each batch
+runs in its own transaction with one SELECT, at most one bulk_update and at
+most one bulk_create per model. Rows that did not change are not written,
+so importing the same file again leaves update_at, and with it sync
+cursors, ETags and cached responses, alone. A batch the database rejects
+is rolled back and reported, and the import goes on with the next one.
+
+A row names its `record` (venue, stop, hunt or message; venue when missing)
+and the `venue_name` it belongs to. The other columns depend on the record:
+
+    venue    city, type_of_place, description, latitude, longitude
+    stop     name, description, latitude, longitude
+    hunt     title, latitude, longitude
+    message  message
+
+GeoJSON features carry the columns as properties and may give the
+coordinates as a Point geometry instead. Venues are matched on venue_name,
+stops on (venue, name), hunts on (venue, title) and messages on
+(venue, message). Children must come after their venue or in the same
+batch. Unknown cities and place types are created.
+"""
+import copy
+import csv
+import itertools
+import json
+import math
+
+from django.db import DataError, IntegrityError, transaction
+
+from .models import City, List_Message, PlaceType, ScavengerHunt, Stops, Venue
+from .signals import bulk_saved
+
+DEFAULT_BATCH_SIZE = 1000
+# Keeps the `venue_name IN (...)` lookups of a batch within database limits
+MAX_BATCH_SIZE = 5000
+# Errors listed in the report; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+# Largest absolute value of each coordinate
+COORDINATE_LIMITS = {"latitude": 90, "longitude": 180}
+
+GEOJSON_SUFFIXES = (".geojson", ".geojsonl", ".geojsons", ".json", ".jsonl")
+
+# record: (model, report key, venue foreign key, matching field, other fields)
+RECORDS = {
+    "stop": (Stops, "stops", "Venue_id", "name", ("description",)),
+    "hunt": (ScavengerHunt, "scavenger_hunts", "venue_id", "title", ()),
+    "message": (List_Message, "messages", "venue_id", "message", ()),
+}
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_csv(file):
+    """(line number, row) of a CSV file opened in text mode."""
+    reader = csv.DictReader(file)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_geojson(file):
+    """
+    (feature number, row) of newline-delimited features, read one line at a
+    time, or of a FeatureCollection. A FeatureCollection is one JSON document
+    and is loaded whole, so use one feature per line for very large files.
+    """
+    first = file.readline()
+    try:
+        feature = json.loads(first)
+    except ValueError:
+        feature = None
+    if isinstance(feature, dict) and feature.get("type") == "Feature":
+        features = itertools.chain([feature], (json.loads(line) for line in file if line.strip()))
+    else:
+        features = json.loads(first + file.read()).get("features", [])
+
+    for number, feature in enumerate(features, 1):
+        row = dict(feature.get("properties") or {})
+        geometry = feature.get("geometry") or {}
+        if geometry.get("type") == "Point":
+            row["longitude"], row["latitude"] = geometry["coordinates"][:2]
+        yield number, row
+
+
+def read_catalog(file, name):
+    """Rows of a catalog file opened in text mode, by the format its name suggests."""
+    return read_geojson(file) if name.lower().endswith(GEOJSON_SUFFIXES) else read_csv(file)
+
+
+def text(row, field, max_length=None):
+    value = row.get(field)
+    if value in (None, ""):
+        raise RowError(f"{field} is required")
+    value = str(value).strip()
+    if max_length is not None and len(value) > max_length:
+        raise RowError(f"{field} is longer than {max_length} characters")
+    return value
+
+
+def number(row, field):
+    try:
+        value = float(row[field])
+    except KeyError:
+        raise RowError(f"{field} is required")
+    except (TypeError, ValueError):
+        raise RowError(f"{field} must be a number")
+    limit = COORDINATE_LIMITS[field]
+    if not math.isfinite(value) or abs(value) > limit:
+        raise RowError(f"{field} must be between -{limit} and {limit}")
+    return value
+
+
+def upsert(queryset, key_fields, incoming):
+    """
+    Make the rows of `queryset` match `incoming`, {key: field values} where
+    key is the tuple of the `key_fields` values. Rows that differ are
+    updated with one bulk_update and missing keys inserted with one
+    bulk_create. Returns the (created, updated) instances.
+    """
+    model = queryset.model
+    auto_now = [field for field in model._meta.concrete_fields if getattr(field, "auto_now", False)]
+    rows = {tuple(getattr(row, field) for field in key_fields): row for row in queryset}
+    created, updated, fields = [], [], set()
+
+    for key, values in incoming.items():
+        row = rows.get(key)
+        if row is None:
+            created.append(model(**values))
+            continue
+        dirty = [field for field, value in values.items() if getattr(row, field) != value]
+        if dirty:
+            for field in dirty:
+                setattr(row, field, values[field])
+            for field in auto_now:
+                field.pre_save(row, False)
+            updated.append(row)
+            fields.update(dirty)
+
+    if updated:
+        model.objects.bulk_update(updated, [*fields, *(field.name for field in auto_now)])
+    if created:
+        model.objects.bulk_create(created)
+    if created or updated:
+        bulk_saved(model, created + updated)
+    return created, updated
+
+
+class CatalogImporter:
+    """
+    Upserts catalog rows in batches of `batch_size`. `progress` is called
+    with the report after every batch.
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+        self.batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+        self.progress = progress
+        self.cities = dict(City.objects.values_list("name", "id"))
+        self.place_types = dict(PlaceType.objects.values_list("name", "id"))
+        self.venues = dict(Venue.objects.values_list("venue_name", "id"))
+        keys = ["venues", *(key for _, key, _, _, _ in RECORDS.values())]
+        self.report = {
+            "rows": 0,
+            "created": dict.fromkeys(keys, 0),
+            "updated": dict.fromkeys(keys, 0),
+            "error_count": 0,
+            "errors": [],
+        }
+
+    def run(self, rows):
+        """Import the (position, row) pairs of `rows` and return the report."""
+        batch = []
+        for item in rows:
+            batch.append(item)
+            if len(batch) == self.batch_size:
+                self.flush(batch)
+                batch = []
+        if batch:
+            self.flush(batch)
+        return self.report
+
+    def flush(self, batch):
+        # Names given ids during the batch, forgotten again if it rolls back
+        self.added = []
+        counts = copy.deepcopy((self.report["created"], self.report["updated"]))
+        try:
+            self.import_batch(batch)
+        except (DataError, IntegrityError) as error:
+            for names, name in self.added:
+                del names[name]
+            self.report["created"], self.report["updated"] = counts
+            self.error(batch[0][0], f"Batch of {len(batch)} rows starting here was rolled back: {error}")
+        self.report["rows"] += len(batch)
+        if self.progress:
+            self.progress(self.report)
+
+    def error(self, position, message):
+        self.report["error_count"] += 1
+        if len(self.report["errors"]) < MAX_REPORTED_ERRORS:
+            self.report["errors"].append({"row": position, "error": str(message)})
+
+    def remember(self, names, name, pk):
+        names[name] = pk
+        self.added.append((names, name))
+
+    def lookup(self, model, names, name):
+        if name not in names:
+            self.remember(names, name, model.objects.create(name=name).id)
+        return names[name]
+
+    def venue_values(self, row):
+        values = {
+            "venue_name": text(row, "venue_name", max_length=100),
+            "latitude": number(row, "latitude"),
+            "longitude": number(row, "longitude"),
+        }
+        city, place_type = text(row, "city", max_length=100), text(row, "type_of_place", max_length=100)
+        values["city_id"] = self.lookup(City, self.cities, city)
+        values["type_of_place_id"] = self.lookup(PlaceType, self.place_types, place_type)
+        if "description" in row:
+            values["description"] = row["description"] or ""
+        return values
+
+    def child_values(self, record, row):
+        model, _, _, match_field, optional = RECORDS[record]
+        values = {match_field: text(row, match_field, model._meta.get_field(match_field).max_length)}
+        if model is not List_Message:
+            values["latitude"] = number(row, "latitude")
+            values["longitude"] = number(row, "longitude")
+        values.update({field: row[field] or "" for field in optional if field in row})
+        return values
+
+    @transaction.atomic
+    def import_batch(self, batch):
+        venues, children = {}, []
+        for position, row in batch:
+            record = str(row.get("record") or "venue").strip().lower()
+            try:
+                if record == "venue":
+                    values = self.venue_values(row)
+                    venues[values["venue_name"]] = values
+                elif record in RECORDS:
+                    children.append((position, record, text(row, "venue_name"), self.child_values(record, row)))
+                else:
+                    raise RowError(f"Unknown record {record!r}")
+            except RowError as error:
+                self.error(position, error)
+
+        if venues:
+            created, updated = upsert(
+                Venue.objects.filter(venue_name__in=list(venues)), ("venue_name",),
+                {(name,): values for name, values in venues.items()},
+            )
+            for venue in created:
+                self.remember(self.venues, venue.venue_name, venue.id)
+            self.report["created"]["venues"] += len(created)
+            self.report["updated"]["venues"] += len(updated)
+
+        incoming = {record: {} for record in RECORDS}
+        for position, record, venue_name, values in children:
+            if venue_name not in self.venues:
+                self.error(position, f"Unknown venue {venue_name!r}")
+                continue
+            _, _, venue_field, match_field, _ = RECORDS[record]
+            values[venue_field] = self.venues[venue_name]
+            incoming[record][(values[venue_field], values[match_field])] = values
+
+        for record, items in incoming.items():
+            if not items:
+                continue
+            model, key, venue_field, match_field, _ = RECORDS[record]
+            venue_ids = {venue_id for venue_id, _ in items}
+            created, updated = upsert(
+                model.objects.filter(**{f"{venue_field}__in": venue_ids}), (venue_field, match_field), items
+            )
+            self.report["created"][key] += len(created)
+            self.report["updated"][key] += len(updated)
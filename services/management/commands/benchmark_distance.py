@@ -0,0 +1,41 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from services.utils import haversine, haversine_many, k_smallest
+
+
+class Command(BaseCommand):
+    help = 'Compare the scalar haversine loop with the vectorized NumPy kernel.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[1_000, 100_000, 1_000_000])
+        parser.add_argument('--k', type=int, default=10)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        lat, lon = 23.81, 90.41
+        k = options['k']
+
+        for n in options['sizes']:
+            lats = np.ascontiguousarray(rng.uniform(20.5, 26.5, n))
+            lons = np.ascontiguousarray(rng.uniform(88.0, 92.7, n))
+
+            start = time.perf_counter()
+            pairs = list(zip(lats.tolist(), lons.tolist()))
+            scalar = sorted(
+                (haversine(lat, lon, v_lat, v_lon), i) for i, (v_lat, v_lon) in enumerate(pairs)
+            )[:k]
+            scalar_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            distances = haversine_many(lat, lon, lats, lons)
+            best = k_smallest(distances, k)
+            vector_ms = (time.perf_counter() - start) * 1000
+
+            assert [i for _, i in scalar] == best.tolist()
+            self.stdout.write(
+                f"n={n:>9,}  scalar {scalar_ms:9.1f} ms  numpy {vector_ms:8.1f} ms  "
+                f"speedup x{scalar_ms / vector_ms:.1f}"
+            )
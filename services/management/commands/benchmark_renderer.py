@@ -0,0 +1,68 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from project.renderers import ORJSONRenderer
+from services.models import City, List_Message, PlaceType, ScavengerHunt, Stops, Venue
+from services.serializers import VenueSerializer
+
+
+def prefetched(model, rows):
+    """A queryset whose results are already loaded, like prefetch_related leaves it."""
+    queryset = model.objects.all()
+    queryset._result_cache = rows
+    queryset._prefetch_done = True
+    return queryset
+
+
+def make_venues(n):
+    """Unsaved venues with nested hunts, stops and messages; no database needed."""
+    city = City(id=1, name="Dhaka")
+    place = PlaceType(id=1, name="Museum")
+    venues = []
+    for i in range(n):
+        venue = Venue(
+            id=i, city=city, type_of_place=place, venue_name=f"Venue {i}",
+            description="A venue description " * 5, latitude=23.8 + i * 1e-4, longitude=90.4,
+        )
+        hunts = [
+            ScavengerHunt(id=i * 3 + j, venue=venue, title=f"Hunt {j}", latitude=23.8, longitude=90.4)
+            for j in range(3) if i % 2
+        ]
+        venue._prefetched_objects_cache = {
+            "scavenger_hunts": prefetched(ScavengerHunt, hunts),
+            "stops": prefetched(Stops, [Stops(id=i, Venue=venue, name="Stop", latitude=23.8, longitude=90.4)]),
+            "messages": prefetched(List_Message, [List_Message(id=i, venue=venue, message="Welcome")]),
+        }
+        venues.append(venue)
+    return venues
+
+
+class Command(BaseCommand):
+    help = 'Compare DRF\'s JSONRenderer with the orjson renderer on a VenueSerializer list.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[100, 1_000, 10_000])
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        for n in options['sizes']:
+            data = VenueSerializer(make_venues(n), many=True, context={'hunt_progress': {}}).data
+
+            timings = {}
+            for renderer in (JSONRenderer(), ORJSONRenderer()):
+                best = float('inf')
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    body = renderer.render(data)
+                    best = min(best, time.perf_counter() - start)
+                timings[type(renderer).__name__] = (best * 1000, body)
+
+            (json_ms, json_body), (orjson_ms, orjson_body) = timings.values()
+            assert json.loads(json_body) == json.loads(orjson_body)
+            self.stdout.write(
+                f"n={n:>7,}  json {json_ms:8.1f} ms  orjson {orjson_ms:7.1f} ms  "
+                f"speedup x{json_ms / orjson_ms:.1f}  ({len(orjson_body) / 1024:,.0f} KiB)"
+            )
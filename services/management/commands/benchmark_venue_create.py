@@ -0,0 +1,67 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from services.models import City, List_Message, PlaceType, ScavengerHunt, Stops, Venue
+from services.serializers import CreateVenueSerializer
+
+
+def nested_payload(n):
+    return {
+        "scavenger_hunts": [{"title": f"Hunt {i}", "latitude": "23.81", "longitude": "90.41"} for i in range(n)],
+        "venue_message": [{"message": f"Message {i}"} for i in range(n)],
+        "stops": [{"name": f"Stop {i}", "latitude": "23.82", "longitude": "90.42"} for i in range(n)],
+    }
+
+
+def create_row_by_row(validated_data):
+    """The previous write path: one INSERT per nested item, no transaction."""
+    hunts = validated_data.pop("scavenger_hunts")
+    messages = validated_data.pop("venue_message")
+    stops = validated_data.pop("stops")
+    venue = Venue.objects.create(**validated_data)
+    for hunt in hunts:
+        ScavengerHunt.objects.create(venue=venue, title=hunt["title"], latitude=float(hunt["latitude"]), longitude=float(hunt["longitude"]))
+    for message in messages:
+        List_Message.objects.create(venue=venue, message=message["message"])
+    for stop in stops:
+        Stops.objects.create(Venue=venue, name=stop["name"], latitude=stop["latitude"], longitude=stop["longitude"])
+    return venue
+
+
+class Command(BaseCommand):
+    help = 'Compare per-row nested inserts with the bulk_create path of CreateVenueSerializer. Nothing is kept.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--children', nargs='+', type=int, default=[10, 50, 200],
+                            help='hunts, messages and stops per venue (each)')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def run(self, create, n):
+        best, queries = float('inf'), 0
+        for i in range(self.repeat):
+            with transaction.atomic():
+                city = City.objects.create(name=f"Benchmark city {i}")
+                place = PlaceType.objects.create(name=f"Benchmark place {i}")
+                validated = {"city": city, "type_of_place": place, "venue_name": f"Benchmark venue {i}",
+                             "latitude": 23.8, "longitude": 90.4, **nested_payload(n)}
+                with CaptureQueriesContext(connection) as ctx:
+                    start = time.perf_counter()
+                    create(validated)
+                    best = min(best, time.perf_counter() - start)
+                queries = len(ctx)
+                transaction.set_rollback(True)
+        return best * 1000, queries
+
+    def handle(self, *args, **options):
+        self.repeat = options['repeat']
+        serializer = CreateVenueSerializer()
+        for n in options['children']:
+            row_ms, row_queries = self.run(create_row_by_row, n)
+            bulk_ms, bulk_queries = self.run(serializer.create, n)
+            self.stdout.write(
+                f"{n:>4} of each child  per-row {row_ms:8.1f} ms / {row_queries:4} queries  "
+                f"bulk {bulk_ms:7.1f} ms / {bulk_queries:3} queries  speedup x{row_ms / bulk_ms:.1f}"
+            )
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from services.bundle import build_bundle
+
+
+class Command(BaseCommand):
+    help = 'Build the offline catalog bundle now instead of waiting for the Celery task.'
+
+    def handle(self, *args, **options):
+        bundle = build_bundle()
+        self.stdout.write(f"Wrote {bundle.file.name} (version {bundle.version}, {bundle.size:,} bytes)")
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from services.images import IMAGE_FIELDS, build_derivatives
+
+
+class Command(BaseCommand):
+    help = 'Write the missing thumbnail/WebP derivatives of every stored image, e.g. for uploads made before the pipeline.'
+
+    def handle(self, *args, **options):
+        for model, fields in IMAGE_FIELDS.items():
+            written = 0
+            for field in fields:
+                names = model._default_manager.exclude(**{field: ""}).exclude(**{f"{field}__isnull": True})
+                for name in names.values_list(field, flat=True).iterator():
+                    written += len(build_derivatives(name))
+            self.stdout.write(f"{model.__name__}: {written} derivative(s) written")
+        self.stdout.write(self.style.SUCCESS('Image derivatives are up to date.'))
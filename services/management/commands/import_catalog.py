@@ -0,0 +1,39 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from services.importer import DEFAULT_BATCH_SIZE, CatalogImporter, read_catalog
+
+
+class Command(BaseCommand):
+    help = 'Upsert venues, stops, scavenger hunts and messages from a CSV or GeoJSON file (see services.importer).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='.csv, or .geojson/.json for a FeatureCollection or one feature per line')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help='rows upserted per transaction')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+
+        def progress(report):
+            self.stdout.write(f"{report['rows']:>8,} rows  {time.perf_counter() - start:6.1f} s")
+
+        importer = CatalogImporter(options['batch_size'], progress=progress)
+        try:
+            with open(options['path'], encoding='utf-8-sig', newline='') as file:
+                report = importer.run(read_catalog(file, options['path']))
+        except OSError as error:
+            raise CommandError(error)
+        except (ValueError, csv.Error) as error:
+            raise CommandError(f"Could not read {options['path']} after {importer.report['rows']:,} rows: {error}")
+
+        for action in ('created', 'updated'):
+            counts = ', '.join(f"{count:,} {key}" for key, count in report[action].items())
+            self.stdout.write(f"{action.capitalize()}: {counts}")
+        for error in report['errors']:
+            self.stderr.write(f"Row {error['row']}: {error['error']}")
+        if report['error_count'] > len(report['errors']):
+            self.stderr.write(f"... {report['error_count'] - len(report['errors'])} more errors")
+        self.stdout.write(self.style.SUCCESS(f"Imported {report['rows']:,} rows in {time.perf_counter() - start:.1f} s."))
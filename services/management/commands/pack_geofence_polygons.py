@@ -0,0 +1,54 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from services.geofence import expire_snapshot, invalidate_geofence_index, pack_polygon, refresh_simplified
+from services.models import GeoFenced, LatLng
+
+
+class Command(BaseCommand):
+    help = (
+        'Move geofence vertices from LatLng rows into the packed GeoFenced.polygon column '
+        'and fill in missing simplified polygons.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        fence_ids = list(
+            GeoFenced.objects.filter(polygon=b"", polygon_points__isnull=False)
+            .values_list('id', flat=True).distinct()
+        )
+
+        packed = 0
+        for start in range(0, len(fence_ids), batch_size):
+            ids = fence_ids[start:start + batch_size]
+            points = defaultdict(lambda: ([], []))
+            for fence_id, lat, lon in LatLng.objects.filter(geo_fenced_area_id__in=ids).order_by('id').values_list(
+                'geo_fenced_area_id', 'latitude', 'longitude'
+            ):
+                points[fence_id][0].append(lat)
+                points[fence_id][1].append(lon)
+
+            fences = [GeoFenced(id=fence_id, polygon=pack_polygon(*points[fence_id])) for fence_id in ids]
+            for fence in fences:
+                refresh_simplified(fence)
+            with transaction.atomic():
+                GeoFenced.objects.bulk_update(fences, ['polygon', 'simplified'])
+                LatLng.objects.filter(geo_fenced_area_id__in=ids).delete()
+            packed += len(ids)
+
+        stale = list(GeoFenced.objects.filter(simplified={}).exclude(polygon=b""))
+        for fence in stale:
+            refresh_simplified(fence)
+        GeoFenced.objects.bulk_update(stale, ['simplified'], batch_size=batch_size)
+
+        # bulk_update sends no signals
+        invalidate_geofence_index()
+        expire_snapshot()
+        self.stdout.write(self.style.SUCCESS(
+            f"Packed {packed} geofence polygon(s), simplified {len(stale)} more."
+        ))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from services import rtree
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the SQLite R*Tree tables for venue, stop, scavenger hunt and attraction coordinates.'
+
+    def handle(self, *args, **options):
+        if not rtree.is_supported():
+            raise CommandError('The R*Tree backend is only available on SQLite.')
+
+        for name, count in rtree.rebuild().items():
+            self.stdout.write(f"{name}: {count} row(s) indexed")
+        self.stdout.write(self.style.SUCCESS('R*Tree tables rebuilt.'))
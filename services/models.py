@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import Exists, F, OuterRef, Window
+from django.db.models.functions import RowNumber
 
 # from accounts.models import User
 
@@ -11,6 +13,9 @@ class City(models.Model):
     create_at = models.DateTimeField(auto_now_add=True)
     update_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["create_at", "id"])]
+
     def __str__(self):
         return self.name
 
@@ -33,6 +38,13 @@ class ScavengerHunt(models.Model):
     create_at = models.DateTimeField(auto_now_add=True)
     update_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=["latitude", "longitude"]),
+            models.Index(fields=["create_at", "id"]),
+            models.Index(fields=["update_at"]),
+        ]
+
     def __str__(self):
         return self.title
     
@@ -56,10 +68,55 @@ class Stops(models.Model):
     create_at = models.DateTimeField(auto_now_add=True)
     update_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=["latitude", "longitude"]),
+            models.Index(fields=["update_at"]),
+        ]
+
     def __str__(self):
         return self.name
     
 
+class VenueQuerySet(models.QuerySet):
+    def with_details(self, fields=None):
+        """
+        Join and prefetch what VenueSerializer/VenueAdminSerializer render.
+        `fields` is the set of serializer fields being rendered (see
+        SparseFieldsMixin.requested_fields); None loads everything.
+        """
+        def wanted(name):
+            return fields is None or name in fields
+
+        queryset = self
+        joins = [name for name in ("city", "type_of_place") if wanted(name)]
+        if joins:
+            queryset = queryset.select_related(*joins)
+        prefetches = [
+            relation
+            for field, relation in (("scavenger_hunts", "scavenger_hunts"), ("stops", "stops"), ("venue_message", "messages"))
+            if wanted(field)
+        ]
+        if prefetches:
+            queryset = queryset.prefetch_related(*prefetches)
+        if not wanted("scavenger_hunts") and (wanted("is_premium") or wanted("stops")):
+            # VenueSerializer still needs to know whether hunts exist
+            queryset = queryset.annotate(
+                has_scavenger_hunts=Exists(ScavengerHunt.objects.filter(venue=OuterRef("pk")))
+            )
+        return queryset
+
+    def top_per_group(self, group_field, n, order_by="id"):
+        """
+        Keep the first `n` venues of each `group_field` value, ranked with
+        ROW_NUMBER() OVER (PARTITION BY group_field ORDER BY order_by).
+        Meant as a Prefetch queryset so every group loads in one query.
+        """
+        return self.annotate(
+            group_rank=Window(RowNumber(), partition_by=F(group_field), order_by=F(order_by).asc())
+        ).filter(group_rank__lte=n).order_by(group_field, "group_rank")
+
+
 class Venue(models.Model):
     city = models.ForeignKey(City, related_name='venues', on_delete=models.CASCADE)
     type_of_place = models.ForeignKey(PlaceType, related_name='venues', on_delete=models.CASCADE)
@@ -71,6 +128,15 @@ class Venue(models.Model):
     create_at = models.DateTimeField(auto_now_add=True)
     update_at = models.DateTimeField(auto_now=True)
 
+    objects = VenueQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["latitude", "longitude"]),
+            models.Index(fields=["create_at", "id"]),
+            models.Index(fields=["update_at"]),
+        ]
+
     def __str__(self):
         return self.venue_name
     
@@ -81,6 +147,12 @@ class List_Message(models.Model):
     create_at = models.DateTimeField(auto_now_add=True)
     update_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["create_at", "id"]),
+            models.Index(fields=["update_at"]),
+        ]
+
     def __str__(self):
         return f"Message for {self.venue.venue_name}"
     
@@ -88,6 +160,12 @@ class GeoFenced(models.Model):
     title = models.CharField(max_length=100)
     alertMessage = models.TextField(blank=True, null=True)
     isRestricted = models.BooleanField(default=False)
+    # Polygon vertices packed as little-endian float64 (latitude, longitude) pairs,
+    # see services.geofence.pack_polygon. Older fences may still keep them as LatLng rows.
+    polygon = models.BinaryField(default=b"", blank=True)
+    # Douglas-Peucker simplified copies of the polygon keyed by precision level,
+    # see services.geofence.PRECISION_LEVELS
+    simplified = models.JSONField(default=dict, blank=True)
 
     def __str__(self):
         return self.title
@@ -120,5 +198,37 @@ class NearByAttraction(models.Model):
     create_at = models.DateTimeField(auto_now_add=True)
     update_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=["latitude", "longitude"]),
+            models.Index(fields=["create_at", "id"]),
+            models.Index(fields=["update_at"]),
+        ]
+
     def __str__(self):
         return self.title
+
+
+class Tombstone(models.Model):
+    """A deleted catalog row, kept so the sync endpoint can report the deletion."""
+    model = models.CharField(max_length=50)
+    object_id = models.PositiveBigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["deleted_at"])]
+
+    def __str__(self):
+        return f"{self.model} #{self.object_id}"
+
+
+class CatalogBundle(models.Model):
+    """A gzipped JSON snapshot of the whole catalog, built by services.tasks."""
+    version = models.BigIntegerField(unique=True)
+    file = models.FileField(upload_to="catalog_bundles/")
+    size = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64)
+    create_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Catalog bundle {self.version}"
@@ -0,0 +1,122 @@
+"""
+Optional SQLite R*Tree backend for point coordinates.
+
+Each spatial model gets a `<table>_rtree` virtual table holding one
+zero-area box per row, keyed by the row's primary key. Signals keep the
+tables in sync (see services.signals) and `manage.py rebuild_rtree`
+recreates them from scratch. Enabled with SPATIAL_BACKEND=rtree on SQLite.
+"""
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import NearByAttraction, ScavengerHunt, Stops, Venue
+from .spatial import box_limits
+
+RTREE_MODELS = [Venue, Stops, ScavengerHunt, NearByAttraction]
+
+_ready = set()
+
+
+def rtree_table(model):
+    return f"{model._meta.db_table}_rtree"
+
+
+def is_supported():
+    return connection.vendor == "sqlite"
+
+
+def _mark_ready():
+    # DDL inside a transaction is rolled back with it, so trust the tables
+    # only once they are committed
+    key = connection.settings_dict["NAME"]
+    transaction.on_commit(lambda: _ready.add(key))
+
+
+def ensure_tables():
+    """Create any missing R*Tree tables, filling new ones from their model."""
+    key = connection.settings_dict["NAME"]
+    if key in _ready:
+        return
+    existing = set(connection.introspection.table_names())
+    with connection.cursor() as cursor:
+        for model in RTREE_MODELS:
+            table = rtree_table(model)
+            if table not in existing:
+                cursor.execute(
+                    f'CREATE VIRTUAL TABLE "{table}" USING rtree(id, min_lat, max_lat, min_lon, max_lon)'
+                )
+                _fill(cursor, model)
+    _mark_ready()
+
+
+def _fill(cursor, model):
+    rows = model.objects.values_list("id", "latitude", "longitude").iterator(chunk_size=2000)
+    cursor.executemany(
+        f'INSERT INTO "{rtree_table(model)}" VALUES (%s, %s, %s, %s, %s)',
+        ((pk, lat, lat, lon, lon) for pk, lat, lon in rows),
+    )
+
+
+def rebuild(models=None):
+    """Drop and refill the R*Tree tables; returns {model name: row count}."""
+    counts = {}
+    with connection.cursor() as cursor:
+        for model in models or RTREE_MODELS:
+            table = rtree_table(model)
+            cursor.execute(f'DROP TABLE IF EXISTS "{table}"')
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE "{table}" USING rtree(id, min_lat, max_lat, min_lon, max_lon)'
+            )
+            _fill(cursor, model)
+            cursor.execute(f'SELECT COUNT(*) FROM "{table}"')
+            counts[model.__name__] = cursor.fetchone()[0]
+    _mark_ready()
+    return counts
+
+
+def upsert(instance):
+    ensure_tables()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT OR REPLACE INTO "{rtree_table(type(instance))}" VALUES (%s, %s, %s, %s, %s)',
+            [instance.pk, instance.latitude, instance.latitude, instance.longitude, instance.longitude],
+        )
+
+
+def upsert_many(model, instances):
+    ensure_tables()
+    rows = []
+    for obj in instances:
+        # Rows from bulk_create keep their raw (possibly string) input values
+        lat, lon = float(obj.latitude), float(obj.longitude)
+        rows.append((obj.pk, lat, lat, lon, lon))
+    with connection.cursor() as cursor:
+        cursor.executemany(f'INSERT OR REPLACE INTO "{rtree_table(model)}" VALUES (%s, %s, %s, %s, %s)', rows)
+
+
+def remove(instance):
+    ensure_tables()
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM "{rtree_table(type(instance))}" WHERE id = %s', [instance.pk])
+
+
+def box_for(model):
+    """
+    Return a box(lat, lon, radius_km) callable, usable with
+    spatial.nearest_in_queryset, that answers the rectangle from the R*Tree.
+    """
+    table = rtree_table(model)
+
+    def box(lat, lon, radius_km):
+        ensure_tables()
+        min_lat, max_lat, lon_ranges = box_limits(lat, lon, radius_km)
+        sql = f'SELECT id FROM "{table}" WHERE max_lat >= %s AND min_lat <= %s'
+        params = [min_lat, max_lat]
+        if lon_ranges:
+            sql += " AND (" + " OR ".join("(max_lon >= %s AND min_lon <= %s)" for _ in lon_ranges) + ")"
+            for min_lon, max_lon in lon_ranges:
+                params += [min_lon, max_lon]
+        return Q(pk__in=RawSQL(sql, params))
+
+    return box
@@ -1,8 +1,14 @@
 from django.core.files.storage import default_storage
 from rest_framework import serializers
+from django.utils.functional import cached_property
 from django.utils import timezone
+from django.db import models, transaction
 from .models import *
+from .geofence import pack_polygon, polygon_of, refresh_simplified
+from .images import ImageDerivativesField
+from .signals import bulk_saved
 import json
+import re
 
 class CitySerializer(serializers.ModelSerializer):
 
@@ -25,28 +31,35 @@ class ScavengerCreateHuntSerializer(serializers.ModelSerializer):
         
 
 class UserScavengerHuntSerializer(serializers.ModelSerializer):
+    uploaded_image_derivatives = ImageDerivativesField(source="uploaded_image")
+
     class Meta:
         model = UserScavengerHunt
-        fields = ["checked", "uploaded_image"]
+        fields = ["checked", "uploaded_image", "uploaded_image_derivatives"]
 
 
 class ScavengerHuntSerializer(serializers.ModelSerializer):
     check = serializers.SerializerMethodField()
     # image = serializers.ImageField(required=False)  # if you have images
+    image_derivatives = ImageDerivativesField(source="image")
 
     class Meta:
         model = ScavengerHunt
-        fields = ["id", "title", "image", "latitude", "longitude", "check"]
+        fields = ["id", "title", "image", "image_derivatives", "latitude", "longitude", "check"]
 
     def get_check(self, obj):
         request = self.context.get("request")
         user = request.user if request else None
         if user and user.is_authenticated:
-            us = UserScavengerHunt.objects.filter(user=user, scavenger_hunt=obj).first()
+            progress = self.context.get("hunt_progress")
+            if progress is not None:
+                us = progress.get(obj.id)
+            else:
+                us = UserScavengerHunt.objects.filter(user=user, scavenger_hunt=obj).first()
             if us:
                 return UserScavengerHuntSerializer(us).data
-            return {"checked": False, "uploaded_image": None}
-        return {"checked": False, "uploaded_image": None}
+            return {"checked": False, "uploaded_image": None, "uploaded_image_derivatives": None}
+        return {"checked": False, "uploaded_image": None, "uploaded_image_derivatives": None}
 
 
 class CreateVenueMessageSerializer(serializers.ModelSerializer):
@@ -87,13 +100,94 @@ class ListStopSerializer(serializers.ModelSerializer):
         ]
 
 
-class VenueAdminSerializer(serializers.ModelSerializer):
+def load_hunt_progress(context, venues):
+    """
+    Put the request user's UserScavengerHunt rows for every hunt of `venues`
+    into context["hunt_progress"] ({scavenger_hunt_id: row}) with one query,
+    so ScavengerHuntSerializer.get_check doesn't query per hunt.
+    """
+    request = context.get("request")
+    user = request.user if request else None
+    progress = {}
+    if user and user.is_authenticated:
+        rows = UserScavengerHunt.objects.filter(
+            user=user, scavenger_hunt__venue__in=[venue.pk for venue in venues]
+        ).order_by("-id")
+        # Newest first, so the oldest row per hunt wins like .first() did
+        progress = {row.scavenger_hunt_id: row for row in rows}
+    context["hunt_progress"] = progress
+    return progress
+
+
+class VenueListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        venues = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        if "hunt_progress" not in self.context and "scavenger_hunts" in self.child.fields:
+            load_hunt_progress(self.context, venues)
+        return super().to_representation(venues)
+
+
+class HuntProgressMixin:
+    """Venue serializers whose nested hunts share one progress lookup."""
+
+    def to_representation(self, instance):
+        if "hunt_progress" not in self.context and "scavenger_hunts" in self.fields:
+            load_hunt_progress(self.context, [instance])
+        return super().to_representation(instance)
+
+
+class SparseFieldsMixin:
+    """
+    Lets the request pick the fields it renders.
+
+    ?fields=id,venue_name keeps only the listed fields and ?expand=stops keeps
+    only the listed nested relations (all of them when ?expand is absent, none
+    for an empty ?expand=). Views pass the same choice to
+    Venue.objects.with_details() so unrendered relations are never loaded.
+    """
+    expandable_fields = ("scavenger_hunts", "stops", "venue_message")
+    computed_fields = ()
+
+    @classmethod
+    def requested_fields(cls, request):
+        """Set of field names the request asks for, or None for all of them."""
+        params = request.query_params if request is not None else {}
+        if "fields" not in params and "expand" not in params:
+            return None
+
+        available = {*cls.Meta.fields, *cls.computed_fields}
+        if "fields" in params:
+            fields = {name.strip() for name in params["fields"].split(",") if name.strip()}
+        else:
+            fields = set(available)
+        unknown = fields - available
+        if "expand" in params:
+            expand = {name.strip() for name in params["expand"].split(",") if name.strip()}
+            unknown |= expand - set(cls.expandable_fields)
+            fields -= set(cls.expandable_fields) - expand
+        if unknown:
+            raise serializers.ValidationError({"error": f"Unknown fields: {', '.join(sorted(unknown))}"})
+        return fields
+
+    @cached_property
+    def requested(self):
+        return self.requested_fields(self.context.get("request"))
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.requested is not None:
+            fields = {name: field for name, field in fields.items() if name in self.requested}
+        return fields
+
+
+class VenueAdminSerializer(SparseFieldsMixin, HuntProgressMixin, serializers.ModelSerializer):
     distance_km = serializers.FloatField(read_only=True)
     scavenger_hunts = ScavengerHuntSerializer(many=True, read_only=True)
     city = serializers.SlugRelatedField(slug_field="name", read_only=True)
     type_of_place = serializers.SlugRelatedField(slug_field="name", read_only=True)
     venue_message = ListMessageSerializer(many=True, read_only=True, source="messages")
     stops = StopSerializer(many=True, read_only=True)
+    image_derivatives = ImageDerivativesField(source="image")
 
     class Meta:
         model = Venue
@@ -103,6 +197,7 @@ class VenueAdminSerializer(serializers.ModelSerializer):
             "type_of_place",
             "venue_name",
             "image",
+            "image_derivatives",
             "description",
             "latitude",
             "longitude",
@@ -111,14 +206,17 @@ class VenueAdminSerializer(serializers.ModelSerializer):
             "stops",
             "venue_message",
         ]
+        list_serializer_class = VenueListSerializer
 
-class VenueSerializer(serializers.ModelSerializer):
+class VenueSerializer(SparseFieldsMixin, HuntProgressMixin, serializers.ModelSerializer):
+    computed_fields = ("is_premium",)
     distance_km = serializers.FloatField(read_only=True)
     scavenger_hunts = ScavengerHuntSerializer(many=True, read_only=True)
     city = serializers.SlugRelatedField(slug_field="name", read_only=True)
     type_of_place = serializers.SlugRelatedField(slug_field="name", read_only=True)
     venue_message = ListMessageSerializer(many=True, read_only=True, source="messages")
     stops = StopSerializer(many=True, read_only=True)
+    image_derivatives = ImageDerivativesField(source="image")
 
     class Meta:
         model = Venue
@@ -128,6 +226,7 @@ class VenueSerializer(serializers.ModelSerializer):
             "type_of_place",
             "venue_name",
             "image",
+            "image_derivatives",
             "description",
             "latitude",
             "longitude",
@@ -136,12 +235,23 @@ class VenueSerializer(serializers.ModelSerializer):
             "stops",
             "venue_message",
         ]
+        list_serializer_class = VenueListSerializer
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        representation['is_premium'] = bool(representation.get('scavenger_hunts'))
+        show_premium = self.requested is None or 'is_premium' in self.requested
+        if 'scavenger_hunts' in representation:
+            is_premium = bool(representation['scavenger_hunts'])
+        elif not show_premium and 'stops' not in representation:
+            return representation
+        elif hasattr(instance, 'has_scavenger_hunts'):
+            is_premium = instance.has_scavenger_hunts
+        else:
+            is_premium = instance.scavenger_hunts.exists()
+        if show_premium:
+            representation['is_premium'] = is_premium
 
-        if representation.get('scavenger_hunts'):
+        if is_premium:
             representation.pop('stops', None)
         else:
             representation.pop('scavenger_hunts', None)
@@ -149,8 +259,46 @@ class VenueSerializer(serializers.ModelSerializer):
         return representation
 
 
+# FormData key of a nested list item field, e.g. stops[0][name]
+NESTED_KEY = re.compile(r"^(\w+)\[(\d+)\]\[(\w+)\]$")
+
+
+class NestedFormDataMixin:
+    """
+    Turns FormData keys like stops[0][name] into {"stops": [{"name": ...}]}
+    before validation, in one pass over the keys. Indexes only order the
+    items, gaps are dropped, and an index of `max_nested_items` or more is
+    rejected so clients can't make the server allocate huge lists.
+    """
+    max_nested_items = 1000
+
+    def to_internal_value(self, data):
+        if hasattr(data, 'getlist'):
+            flat = {}
+            for key in data.keys():
+                values = data.getlist(key)
+                flat[key] = values[0] if len(values) == 1 else values
+        else:
+            flat = dict(data)
+
+        nested = {}
+        for key in list(flat):
+            match = NESTED_KEY.match(key)
+            if match is None:
+                continue
+            name, index, field = match.groups()
+            if len(index) > len(str(self.max_nested_items)) or int(index) >= self.max_nested_items:
+                raise serializers.ValidationError(
+                    {name: [f"Index {index} is out of range, at most {self.max_nested_items} items are allowed."]}
+                )
+            nested.setdefault(name, {}).setdefault(int(index), {})[field] = flat.pop(key)
+
+        for name, items in nested.items():
+            flat[name] = [items[index] for index in sorted(items)]
+        return super().to_internal_value(flat)
+
 
-class CreateVenueSerializer(serializers.ModelSerializer):
+class CreateVenueSerializer(NestedFormDataMixin, serializers.ModelSerializer):
     city = serializers.PrimaryKeyRelatedField(queryset=City.objects.all())
     type_of_place = serializers.PrimaryKeyRelatedField(queryset=PlaceType.objects.all())
     scavenger_hunts = serializers.ListField(
@@ -177,94 +325,6 @@ class CreateVenueSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ["id"]
 
-    def to_internal_value(self, data):
-        """Handle FormData with nested arrays"""
-        # Convert QueryDict/FormData to regular dict for easier processing
-        if hasattr(data, 'dict'):
-            # For QueryDict (FormData), use dict() to get all values
-            data_dict = {}
-            for key in data.keys():
-                # Get all values for this key (in case of multiple values)
-                values = data.getlist(key)
-                if len(values) == 1:
-                    data_dict[key] = values[0]
-                else:
-                    data_dict[key] = values
-            data = data_dict
-        elif hasattr(data, 'copy'):
-            data = data.copy()
-        
-        # Parse scavenger_hunts from FormData format
-        scavenger_hunts = []
-        venue_messages = []
-        stops = []
-        
-        # Extract all keys and group by pattern
-        keys_to_remove = []
-        for key, value in data.items():
-            # Handle scavenger_hunts[index][field] pattern
-            if key.startswith('scavenger_hunts[') and (key.endswith('][title]') or key.endswith('][image]') or key.endswith('][latitude]') or key.endswith('][longitude]')):
-                try:
-                    # Extract index and field from scavenger_hunts[0][title] or scavenger_hunts[0][image]
-                    parts = key.split('[')
-                    index = int(parts[1].split(']')[0])
-                    field = parts[2].split(']')[0]  # 'title' or 'image' or 'latitude' or 'longitude'
-
-                    # Ensure we have enough items in the list
-                    while len(scavenger_hunts) <= index:
-                        scavenger_hunts.append({})
-                    
-                    scavenger_hunts[index][field] = value
-                    keys_to_remove.append(key)
-                except (ValueError, IndexError):
-                    pass  # Skip invalid keys
-            
-            # Handle venue_message[index][field] pattern
-            elif key.startswith('venue_message[') and key.endswith('][message]'):
-                try:
-                    # Extract index from venue_message[0][message]
-                    index = int(key.split('[')[1].split(']')[0])
-                    
-                    # Ensure we have enough items in the list
-                    while len(venue_messages) <= index:
-                        venue_messages.append({})
-                    
-                    venue_messages[index]['message'] = value
-                    keys_to_remove.append(key)
-                except (ValueError, IndexError):
-                    pass  # Skip invalid keys
-            
-            # Handle stops[index][field] pattern
-            elif key.startswith('stops[') and (key.endswith('][name]') or key.endswith('][description]') or key.endswith('][latitude]') or key.endswith('][longitude]')):
-                try:
-                    # Extract index and field from stops[0][name], stops[0][description], etc.
-                    parts = key.split('[')
-                    index = int(parts[1].split(']')[0])
-                    field = parts[2].split(']')[0]  # 'name', 'description', 'latitude', 'longitude'
-                    
-                    # Ensure we have enough items in the list
-                    while len(stops) <= index:
-                        stops.append({})
-                    
-                    stops[index][field] = value
-                    keys_to_remove.append(key)
-                except (ValueError, IndexError):
-                    pass  # Skip invalid keys
-        
-        # Remove processed keys from data
-        for key in keys_to_remove:
-            if key in data:
-                del data[key]
-        
-        # Add parsed arrays back to data
-        if scavenger_hunts:
-            data['scavenger_hunts'] = scavenger_hunts
-        if venue_messages:
-            data['venue_message'] = venue_messages
-        if stops:
-            data['stops'] = stops
-        
-        return super().to_internal_value(data)
     def to_representation(self, instance):
         """Override to return names instead of IDs in the response"""
         data = super().to_representation(instance)
@@ -279,6 +339,18 @@ class CreateVenueSerializer(serializers.ModelSerializer):
         
         return data
 
+    def validate_stops(self, value):
+        # Checked before anything is written, so a bad stop is a 400 rather than a failed INSERT
+        for stop_data in value:
+            for field in ['latitude', 'longitude']:
+                if field in stop_data:
+                    try:
+                        stop_data[field] = float(stop_data[field])
+                    except (TypeError, ValueError):
+                        raise serializers.ValidationError(f"{field} must be a number.")
+        return value
+
+    @transaction.atomic
     def create(self, validated_data):
         # Extract nested data
         scavenger_hunts_data = validated_data.pop('scavenger_hunts', [])
@@ -288,7 +360,8 @@ class CreateVenueSerializer(serializers.ModelSerializer):
         # Create the venue
         venue = Venue.objects.create(**validated_data)
         
-        # Create scavenger hunts
+        # Build scavenger hunts
+        hunts = []
         for hunt_data in scavenger_hunts_data:
             if 'title' in hunt_data:
                 # Parse latitude/longitude if provided (FormData values may be strings)
@@ -303,37 +376,115 @@ class CreateVenueSerializer(serializers.ModelSerializer):
                 except (TypeError, ValueError):
                     lon = 0.0
 
-                ScavengerHunt.objects.create(
+                hunts.append(ScavengerHunt(
                     venue=venue,
                     title=hunt_data['title'],
                     image=hunt_data.get('image', None),
                     latitude=lat,
                     longitude=lon
-                )
+                ))
         
-        # Create venue messages
-        for message_data in venue_messages_data:
-            if 'message' in message_data:
-                List_Message.objects.create(
-                    venue=venue,
-                    message=message_data['message']
-                )
+        # Build venue messages
+        messages = [
+            List_Message(venue=venue, message=message_data['message'])
+            for message_data in venue_messages_data
+            if 'message' in message_data
+        ]
         
-        # Create stops
-        for stop_data in stops_data:
-            if all(field in stop_data for field in ['name', 'latitude', 'longitude']):
-                Stops.objects.create(
-                    Venue=venue,
-                    name=stop_data['name'],
-                    description=stop_data.get('description', ''),
-                    latitude=stop_data['latitude'],
-                    longitude=stop_data['longitude']
-                )
+        # Build stops
+        stops = [
+            Stops(
+                Venue=venue,
+                name=stop_data['name'],
+                description=stop_data.get('description', ''),
+                latitude=stop_data['latitude'],
+                longitude=stop_data['longitude']
+            )
+            for stop_data in stops_data
+            if all(field in stop_data for field in ['name', 'latitude', 'longitude'])
+        ]
+        
+        # One INSERT per child type, all in the venue's transaction
+        for model, rows in ((ScavengerHunt, hunts), (List_Message, messages), (Stops, stops)):
+            if rows:
+                model.objects.bulk_create(rows)
+                bulk_saved(model, rows)
         
         return venue
 
 
-class UpdateVenueSerializer(serializers.ModelSerializer):
+def clean_hunt(item):
+    """Scavenger hunt fields present in a nested item, coordinates as floats (0.0 when unparseable)."""
+    values = {field: item[field] for field in ['title', 'image'] if field in item}
+    for field in ['latitude', 'longitude']:
+        if field in item:
+            try:
+                values[field] = float(item[field]) if item[field] not in (None, '') else 0.0
+            except (TypeError, ValueError):
+                values[field] = 0.0
+    return values
+
+
+def clean_stop(item):
+    """Stop fields present in a nested item, coordinates as floats."""
+    values = {field: item[field] for field in ['name', 'description'] if field in item}
+    for field in ['latitude', 'longitude']:
+        if field in item:
+            try:
+                values[field] = float(item[field])
+            except (TypeError, ValueError):
+                raise serializers.ValidationError({'stops': [f"{field} must be a number."]})
+    return values
+
+
+def sync_children(existing, items, name, clean, required, defaults):
+    """
+    Make the rows of `existing` match the nested `items` of an update.
+
+    Items whose id is one of the rows update the fields they carry, items
+    without an id are inserted when they carry every `required` field, and
+    rows no item refers to are deleted. Unchanged rows are not written, so
+    one bulk_update, one bulk_create and one delete at most.
+    """
+    model = existing.model
+    rows = {row.pk: row for row in existing}
+    auto_now = [field for field in model._meta.concrete_fields if getattr(field, 'auto_now', False)]
+    changed, created, kept, fields = [], [], set(), set()
+
+    for item in items:
+        values = clean(item)
+        if item.get('id') in (None, ''):
+            if all(field in item for field in required):
+                created.append(model(**{**defaults, **values}))
+            continue
+        try:
+            row = rows[int(item['id'])]
+        except (KeyError, TypeError, ValueError):
+            raise serializers.ValidationError({name: [f"Unknown id {item['id']} for this venue."]})
+        kept.add(row.pk)
+
+        dirty = [field for field, value in values.items() if getattr(row, field) != value]
+        if dirty:
+            for field in dirty:
+                setattr(row, field, values[field])
+            # bulk_update skips pre_save: commit uploaded files and bump update_at here
+            for field in [*(model._meta.get_field(f) for f in dirty), *auto_now]:
+                field.pre_save(row, False)
+            changed.append(row)
+            fields.update(dirty, (field.name for field in auto_now))
+
+    removed = [pk for pk in rows if pk not in kept]
+    if removed:
+        model.objects.filter(pk__in=removed).delete()
+    if changed:
+        model.objects.bulk_update(changed, list(fields))
+    if created:
+        model.objects.bulk_create(created)
+    if changed or created:
+        bulk_saved(model, changed + created)
+
+
+class UpdateVenueSerializer(NestedFormDataMixin, serializers.ModelSerializer):
     city = serializers.PrimaryKeyRelatedField(queryset=City.objects.all())
     type_of_place = serializers.PrimaryKeyRelatedField(queryset=PlaceType.objects.all())
     scavenger_hunts = serializers.ListField(
@@ -360,94 +511,6 @@ class UpdateVenueSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ["id"]
 
-    def to_internal_value(self, data):
-        """Handle FormData with nested arrays"""
-        # Convert QueryDict/FormData to regular dict for easier processing
-        if hasattr(data, 'dict'):
-            # For QueryDict (FormData), use dict() to get all values
-            data_dict = {}
-            for key in data.keys():
-                # Get all values for this key (in case of multiple values)
-                values = data.getlist(key)
-                if len(values) == 1:
-                    data_dict[key] = values[0]
-                else:
-                    data_dict[key] = values
-            data = data_dict
-        elif hasattr(data, 'copy'):
-            data = data.copy()
-        
-        # Parse scavenger_hunts from FormData format
-        scavenger_hunts = []
-        venue_messages = []
-        stops = []
-        
-        # Extract all keys and group by pattern
-        keys_to_remove = []
-        for key, value in data.items():
-            # Handle scavenger_hunts[index][field] pattern
-            if key.startswith('scavenger_hunts[') and (key.endswith('][title]') or key.endswith('][image]') or key.endswith('][latitude]') or key.endswith('][longitude]')):
-                try:
-                    # Extract index and field from scavenger_hunts[0][title] or scavenger_hunts[0][image]
-                    parts = key.split('[')
-                    index = int(parts[1].split(']')[0])
-                    field = parts[2].split(']')[0]  # 'title' or 'image' or 'latitude' or 'longitude'
-
-                    # Ensure we have enough items in the list
-                    while len(scavenger_hunts) <= index:
-                        scavenger_hunts.append({})
-                    
-                    scavenger_hunts[index][field] = value
-                    keys_to_remove.append(key)
-                except (ValueError, IndexError):
-                    pass  # Skip invalid keys
-            
-            # Handle venue_message[index][field] pattern
-            elif key.startswith('venue_message[') and key.endswith('][message]'):
-                try:
-                    # Extract index from venue_message[0][message]
-                    index = int(key.split('[')[1].split(']')[0])
-                    
-                    # Ensure we have enough items in the list
-                    while len(venue_messages) <= index:
-                        venue_messages.append({})
-                    
-                    venue_messages[index]['message'] = value
-                    keys_to_remove.append(key)
-                except (ValueError, IndexError):
-                    pass  # Skip invalid keys
-            
-            # Handle stops[index][field] pattern
-            elif key.startswith('stops[') and (key.endswith('][name]') or key.endswith('][description]') or key.endswith('][latitude]') or key.endswith('][longitude]')):
-                try:
-                    # Extract index and field from stops[0][name], stops[0][description], etc.
-                    parts = key.split('[')
-                    index = int(parts[1].split(']')[0])
-                    field = parts[2].split(']')[0]  # 'name', 'description', 'latitude', 'longitude'
-                    
-                    # Ensure we have enough items in the list
-                    while len(stops) <= index:
-                        stops.append({})
-                    
-                    stops[index][field] = value
-                    keys_to_remove.append(key)
-                except (ValueError, IndexError):
-                    pass  # Skip invalid keys
-        
-        # Remove processed keys from data
-        for key in keys_to_remove:
-            if key in data:
-                del data[key]
-        
-        # Add parsed arrays back to data
-        if scavenger_hunts:
-            data['scavenger_hunts'] = scavenger_hunts
-        if venue_messages:
-            data['venue_message'] = venue_messages
-        if stops:
-            data['stops'] = stops
-        
-        return super().to_internal_value(data)
     
     def to_representation(self, instance):
         """Override to return names instead of IDs in the response"""
@@ -463,6 +526,7 @@ class UpdateVenueSerializer(serializers.ModelSerializer):
         
         return data
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         # Extract nested data
         scavenger_hunts_data = validated_data.pop('scavenger_hunts', [])
@@ -474,64 +538,31 @@ class UpdateVenueSerializer(serializers.ModelSerializer):
             setattr(instance, attr, value)
         instance.save()
         
-        # Handle scavenger hunts - replace all existing ones
+        # Nested lists replace the venue's rows, matched by id (see sync_children)
         if scavenger_hunts_data:
-            # Remove existing scavenger hunts
-            instance.scavenger_hunts.all().delete()
-            # Create new scavenger hunts
-            for hunt_data in scavenger_hunts_data:
-                if 'title' in hunt_data:
-                    lat = hunt_data.get('latitude')
-                    lon = hunt_data.get('longitude')
-                    try:
-                        lat = float(lat) if lat not in (None, '') else 0.0
-                    except (TypeError, ValueError):
-                        lat = 0.0
-                    try:
-                        lon = float(lon) if lon not in (None, '') else 0.0
-                    except (TypeError, ValueError):
-                        lon = 0.0
-
-                    ScavengerHunt.objects.create(
-                        venue=instance,
-                        title=hunt_data['title'],
-                        image=hunt_data.get('image', None),
-                        latitude=lat,
-                        longitude=lon
-                    )
+            sync_children(
+                instance.scavenger_hunts.all(), scavenger_hunts_data, 'scavenger_hunts',
+                clean=clean_hunt, required=['title'],
+                defaults={'venue': instance, 'image': None, 'latitude': 0.0, 'longitude': 0.0},
+            )
         
-        # Handle venue messages - replace all existing ones
         if venue_messages_data:
-            # Remove existing venue messages
-            instance.messages.all().delete()
-            # Create new venue messages
-            for message_data in venue_messages_data:
-                if 'message' in message_data:
-                    List_Message.objects.create(
-                        venue=instance,
-                        message=message_data['message']
-                    )
+            sync_children(
+                instance.messages.all(), venue_messages_data, 'venue_message',
+                clean=lambda item: {'message': item['message']} if 'message' in item else {},
+                required=['message'], defaults={'venue': instance},
+            )
         
-        # Handle stops - replace all existing ones
         if stops_data:
-            # Remove existing stops
-            instance.stops.all().delete()
-            # Create new stops
-            for stop_data in stops_data:
-                if all(field in stop_data for field in ['name', 'latitude', 'longitude']):
-                    Stops.objects.create(
-                        Venue=instance,
-                        name=stop_data['name'],
-                        description=stop_data.get('description', ''),
-                        latitude=stop_data['latitude'],
-                        longitude=stop_data['longitude']
-                    )
+            sync_children(
+                instance.stops.all(), stops_data, 'stops',
+                clean=clean_stop,
+                required=['name', 'latitude', 'longitude'], defaults={'Venue': instance, 'description': ''},
+            )
         
         return instance
 
 
-    
-    
 class UserScavengerHuntUpdateSerializer(serializers.ModelSerializer):
     check = serializers.BooleanField(source="checked", required=False)
     image = serializers.ImageField(source="uploaded_image", required=False)
@@ -562,23 +593,52 @@ class LatLngSerializer(serializers.ModelSerializer):
         fields = ["latitude", "longitude"]
 
 
+class PolygonField(serializers.ListField):
+    """
+    A GeoFenced polygon as a list of {"latitude", "longitude"} points,
+    stored packed in GeoFenced.polygon.
+    """
+    child = LatLngSerializer()
+
+    def __init__(self, **kwargs):
+        kwargs["source"] = "*"
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        points = super().to_internal_value(data)
+        if len(points) < 4:
+            raise serializers.ValidationError("A polygon must have at least 4 points.")
+        return {
+            "polygon": pack_polygon(
+                [point["latitude"] for point in points],
+                [point["longitude"] for point in points],
+            )
+        }
+
+    def to_representation(self, instance):
+        # ?precision= picks a precomputed simplified copy (see GeoFencedViews)
+        level = self.context.get("precision")
+        if level in (instance.simplified or {}):
+            return [{"latitude": lat, "longitude": lon} for lat, lon in instance.simplified[level]]
+
+        lats, lons = polygon_of(instance)
+        return [
+            {"latitude": lat, "longitude": lon}
+            for lat, lon in zip(lats.tolist(), lons.tolist())
+        ]
+
+
 class GeoFencedSerializer(serializers.ModelSerializer):
-    polygon_points = LatLngSerializer(many=True)
+    polygon_points = PolygonField()
 
     class Meta:
         model = GeoFenced
         fields = ["id", "title", "alertMessage", "polygon_points", "isRestricted"]
 
-    def validate_polygon_points(self, value):
-        if len(value) < 4:
-            raise serializers.ValidationError("A polygon must have at least 4 points.")
-        return value
-
     def create(self, validated_data):
-        polygon_points_data = validated_data.pop("polygon_points")
-        geo_fenced_area = GeoFenced.objects.create(**validated_data)
-        for point_data in polygon_points_data:
-            LatLng.objects.create(geo_fenced_area=geo_fenced_area, **point_data)
+        geo_fenced_area = GeoFenced(**validated_data)
+        refresh_simplified(geo_fenced_area)
+        geo_fenced_area.save()
         return geo_fenced_area
 
     def update(self, instance, validated_data):
@@ -586,25 +646,42 @@ class GeoFencedSerializer(serializers.ModelSerializer):
         instance.title = validated_data.get("title", instance.title)
         instance.alertMessage = validated_data.get("alertMessage", instance.alertMessage)
         instance.isRestricted = validated_data.get("isRestricted", instance.isRestricted)
-        instance.save()
 
-        # Handle polygon_points
-        polygon_points_data = validated_data.pop("polygon_points", None)
-        if polygon_points_data is not None:
-            # Remove old points
+        # Handle polygon_points; the packed polygon replaces any legacy LatLng rows
+        polygon = validated_data.get("polygon")
+        if polygon is not None:
+            instance.polygon = polygon
             instance.polygon_points.all().delete()
-            # Add new ones
-            for point_data in polygon_points_data:
-                LatLng.objects.create(geo_fenced_area=instance, **point_data)
-
+            refresh_simplified(instance)
+        instance.save()
         return instance
 
 
+class GeoFenceCheckSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = GeoFenced
+        fields = ["id", "title", "alertMessage", "isRestricted"]
+
+
+class LocationPingSerializer(serializers.Serializer):
+    latitude = serializers.FloatField(min_value=-90, max_value=90)
+    longitude = serializers.FloatField(min_value=-180, max_value=180)
+    timestamp = serializers.DateTimeField()
+
+
+class GeoFenceEventsSerializer(serializers.Serializer):
+    pings = LocationPingSerializer(many=True, allow_empty=False, max_length=1000)
+    # ids of the fences the client was inside before the first ping
+    inside = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+
+
 
 class VenueForCitySerializer(serializers.ModelSerializer):
+    image_derivatives = ImageDerivativesField(source="image")
+
     class Meta:
         model = Venue
-        fields = ['id', 'venue_name', 'image',] 
+        fields = ['id', 'venue_name', 'image', 'image_derivatives',] 
 
 
 class CityByVenueSerializer(serializers.ModelSerializer):
@@ -615,13 +692,73 @@ class CityByVenueSerializer(serializers.ModelSerializer):
         fields = ['id', 'name',  'venues']
 
     def get_venues(self, obj):
-        venues = obj.venues.all()[:2]  
+        # CityVenuesAPIView prefetches the first 2 venues as top_venues
+        venues = getattr(obj, "top_venues", None)
+        if venues is None:
+            venues = obj.venues.all()[:2]
         return VenueForCitySerializer(venues, many=True).data
     
     
     
 class NearByAttractionSerializer(serializers.ModelSerializer):
+    distance_km = serializers.FloatField(read_only=True)
+    image_derivatives = ImageDerivativesField(source="image")
+
     class Meta:
         model = NearByAttraction
         fields = "__all__"
-        read_only_fields = ["id", "create_at", "update_at"]
\ No newline at end of file
+        read_only_fields = ["id", "create_at", "update_at"]
+
+
+class SyncVenueSerializer(serializers.ModelSerializer):
+    city = serializers.SlugRelatedField(slug_field="name", read_only=True)
+    type_of_place = serializers.SlugRelatedField(slug_field="name", read_only=True)
+    image_derivatives = ImageDerivativesField(source="image")
+
+    class Meta:
+        model = Venue
+        fields = [
+            "id", "city", "type_of_place", "venue_name", "image", "image_derivatives", "description",
+            "latitude", "longitude", "update_at",
+        ]
+
+
+class SyncStopSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Stops
+        fields = ["id", "Venue", "name", "description", "latitude", "longitude", "update_at"]
+
+
+class SyncScavengerHuntSerializer(serializers.ModelSerializer):
+    image_derivatives = ImageDerivativesField(source="image")
+
+    class Meta:
+        model = ScavengerHunt
+        fields = ["id", "venue", "title", "image", "image_derivatives", "latitude", "longitude", "update_at"]
+
+
+class SyncMessageSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = List_Message
+        fields = ["id", "venue", "message", "update_at"]
+
+
+class SyncNearByAttractionSerializer(serializers.ModelSerializer):
+    image_derivatives = ImageDerivativesField(source="image")
+
+    class Meta:
+        model = NearByAttraction
+        fields = [
+            "id", "title", "description", "category", "image", "image_derivatives",
+            "latitude", "longitude", "update_at",
+        ]
+
+
+# Sync endpoint / offline bundle key -> serializer of its rows
+SYNC_SERIALIZERS = {
+    "venues": SyncVenueSerializer,
+    "stops": SyncStopSerializer,
+    "scavenger_hunts": SyncScavengerHuntSerializer,
+    "messages": SyncMessageSerializer,
+    "nearby_attractions": SyncNearByAttractionSerializer,
+}
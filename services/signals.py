@@ -0,0 +1,125 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import rtree
+from .bundle import schedule_bundle_build
+from .cache import bump_version
+from .geofence import expire_snapshot, invalidate_geofence_index
+from .images import IMAGE_FIELDS, schedule_derivatives
+from .models import City, GeoFenced, LatLng, List_Message, NearByAttraction, PlaceType, ScavengerHunt, Stops, Venue
+from .spatial import invalidate_venue_index, register_sqlite_functions, spatial_backend
+from .sync import SYNC_MODELS, record_deletion
+
+
+@receiver(connection_created)
+def add_sqlite_functions(sender, connection, **kwargs):
+    if connection.vendor == "sqlite":
+        register_sqlite_functions(connection)
+
+
+@receiver(post_save, sender=Venue)
+@receiver(post_delete, sender=Venue)
+def reset_venue_index(sender, **kwargs):
+    # The grid is rebuilt lazily on the next nearest-venue lookup
+    invalidate_venue_index()
+
+
+@receiver(post_save, sender=GeoFenced)
+@receiver(post_delete, sender=GeoFenced)
+@receiver(post_save, sender=LatLng)
+@receiver(post_delete, sender=LatLng)
+def reset_geofence_index(sender, **kwargs):
+    invalidate_geofence_index()
+
+
+@receiver(post_save, sender=GeoFenced)
+@receiver(post_delete, sender=GeoFenced)
+@receiver(post_save, sender=LatLng)
+@receiver(post_delete, sender=LatLng)
+def reset_geofence_snapshot(sender, **kwargs):
+    expire_snapshot()
+
+
+# Models the cached catalog responses are built from (see services.cache)
+CATALOG_MODELS = [City, PlaceType, Venue, Stops, ScavengerHunt, List_Message, NearByAttraction]
+
+
+def expire_catalog_responses(sender, **kwargs):
+    bump_version(sender)
+
+
+for model in CATALOG_MODELS:
+    post_save.connect(expire_catalog_responses, sender=model, dispatch_uid=f"catalog-save-{model.__name__}")
+    post_delete.connect(expire_catalog_responses, sender=model, dispatch_uid=f"catalog-delete-{model.__name__}")
+
+
+def rebuild_catalog_bundle(sender, **kwargs):
+    schedule_bundle_build()
+
+
+for model in [*CATALOG_MODELS, GeoFenced, LatLng]:
+    post_save.connect(rebuild_catalog_bundle, sender=model, dispatch_uid=f"bundle-save-{model.__name__}")
+    post_delete.connect(rebuild_catalog_bundle, sender=model, dispatch_uid=f"bundle-delete-{model.__name__}")
+
+
+def log_deletion(sender, instance, **kwargs):
+    # Tombstones tell syncing clients what to drop
+    record_deletion(instance)
+
+
+for model in SYNC_MODELS.values():
+    post_delete.connect(log_deletion, sender=model, dispatch_uid=f"tombstone-{model.__name__}")
+
+
+def sync_rtree(sender, instance, **kwargs):
+    if spatial_backend() == "rtree":
+        rtree.upsert(instance)
+
+
+def remove_from_rtree(sender, instance, **kwargs):
+    if spatial_backend() == "rtree":
+        rtree.remove(instance)
+
+
+for model in rtree.RTREE_MODELS:
+    post_save.connect(sync_rtree, sender=model, dispatch_uid=f"rtree-save-{model.__name__}")
+    post_delete.connect(remove_from_rtree, sender=model, dispatch_uid=f"rtree-delete-{model.__name__}")
+
+
+def note_new_images(sender, instance, raw=False, **kwargs):
+    # Uploaded files are committed to storage during save, so look before it
+    if not raw:
+        instance._new_images = [
+            name for name in IMAGE_FIELDS[sender]
+            if getattr(instance, name) and not getattr(instance, name)._committed
+        ]
+
+
+def queue_image_derivatives(sender, instance, **kwargs):
+    names = instance.__dict__.pop("_new_images", None)
+    if names:
+        schedule_derivatives([getattr(instance, name).name for name in names])
+
+
+for model in IMAGE_FIELDS:
+    pre_save.connect(note_new_images, sender=model, dispatch_uid=f"images-pre-save-{model.__name__}")
+    post_save.connect(queue_image_derivatives, sender=model, dispatch_uid=f"images-save-{model.__name__}")
+
+
+def bulk_saved(model, instances):
+    """
+    Do what the post_save receivers above would have done for rows written
+    with bulk_create or bulk_update, which send no signals.
+    """
+    bump_version(model)
+    schedule_bundle_build()
+    if model is Venue:
+        invalidate_venue_index()
+    if model in rtree.RTREE_MODELS and spatial_backend() == "rtree":
+        rtree.upsert_many(model, instances)
+    if model in IMAGE_FIELDS:
+        # Files of unchanged images already have derivatives; the task skips them
+        schedule_derivatives([
+            getattr(instance, name).name for instance in instances for name in IMAGE_FIELDS[model]
+        ])
@@ -0,0 +1,375 @@
+import math
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F, FloatField, Func, Q, Value
+from django.db.models.functions import Round
+from rest_framework.exceptions import ValidationError
+
+from .utils import EARTH_RADIUS_KM, haversine, haversine_many, is_coordinate, k_smallest
+
+
+class VenueGridIndex:
+    """
+    Uniform lat/lon grid over venue coordinates.
+
+    Ids and coordinates are kept as contiguous arrays sorted by cell, so each
+    cell is a (start, stop) slice. k-nearest lookups start at the query's cell
+    and walk outward one ring of cells at a time, stopping as soon as the k-th
+    best distance is closer than anything an unvisited ring could contain. Once
+    a ring has more cells than there are occupied cells, walking on costs more
+    than ranking every venue, so the lookup switches to one full scan.
+    """
+
+    def __init__(self, ids, lats, lons, cell_deg=0.25):
+        self.cell_deg = cell_deg
+        self.rows = int(math.ceil(180 / cell_deg))
+        self.cols = int(math.ceil(360 / cell_deg))
+
+        ids = np.asarray(ids, dtype=np.int64)
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        rows = np.minimum(((lats + 90) // cell_deg).astype(np.int64), self.rows - 1)
+        cols = (((lons + 180) % 360) // cell_deg).astype(np.int64)
+        keys = rows * self.cols + cols
+        order = np.argsort(keys, kind="stable")
+
+        self.ids = np.ascontiguousarray(ids[order])
+        self.lats = np.ascontiguousarray(lats[order])
+        self.lons = np.ascontiguousarray(lons[order])
+        self.size = len(self.ids)
+        self.max_abs_lat = float(np.abs(lats).max()) if self.size else 0.0
+
+        cell_keys, starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+        self.cells = {
+            divmod(int(key), self.cols): (int(start), int(start + count))
+            for key, start, count in zip(cell_keys, starts, counts)
+        }
+
+    @classmethod
+    def from_queryset(cls, queryset, **kwargs):
+        rows = list(queryset.values_list("id", "latitude", "longitude"))
+        ids, lats, lons = zip(*rows) if rows else ((), (), ())
+        return cls(ids, lats, lons, **kwargs)
+
+    def _cell(self, lat, lon):
+        row = min(int((lat + 90) // self.cell_deg), self.rows - 1)
+        col = int(((lon + 180) % 360) // self.cell_deg)
+        return row, col
+
+    def _ring(self, row, col, r):
+        # Cells at Chebyshev distance exactly r; columns wrap around the antimeridian
+        if r == 0:
+            yield row, col
+            return
+        cols = {(col + dc) % self.cols for dc in range(-r, r + 1)}
+        for dr in (-r, r):
+            if 0 <= row + dr < self.rows:
+                for c in cols:
+                    yield row + dr, c
+        side_cols = {(col - r) % self.cols, (col + r) % self.cols}
+        for dr in range(-r + 1, r):
+            if 0 <= row + dr < self.rows:
+                for c in side_cols:
+                    yield row + dr, c
+
+    def _lower_bound_km(self, lat, r):
+        # Any venue outside rings 0..r differs from the query by more than
+        # r cells in latitude or in longitude.
+        gap = math.radians(r * self.cell_deg)
+        lat_bound = EARTH_RADIUS_KM * gap
+        cos_q = math.cos(math.radians(lat))
+        cos_max = math.cos(math.radians(self.max_abs_lat))
+        s = math.sqrt(max(cos_q * cos_max, 0.0)) * math.sin(min(gap, math.pi) / 2)
+        lon_bound = 2 * EARTH_RADIUS_KM * math.asin(min(s, 1.0))
+        return min(lat_bound, lon_bound)
+
+    def nearest(self, lat, lon, k):
+        """Return up to k (distance_km, id) pairs, closest first."""
+        k = min(k, self.size)
+        if k <= 0:
+            return []
+
+        row, col = self._cell(lat, lon)
+        max_r = max(self.rows, self.cols // 2 + 1)
+        candidates = np.empty(0, dtype=np.intp)
+        distances = np.empty(0, dtype=np.float64)
+        for r in range(max_r + 1):
+            if 8 * r > len(self.cells):
+                distances = haversine_many(lat, lon, self.lats, self.lons)
+                best = k_smallest(distances, k)
+                return [(float(distances[i]), int(self.ids[i])) for i in best]
+            ring = [np.arange(*self.cells[cell]) for cell in self._ring(row, col, r) if cell in self.cells]
+            if ring:
+                ring = np.concatenate(ring)
+                candidates = np.concatenate([candidates, ring])
+                distances = np.concatenate(
+                    [distances, haversine_many(lat, lon, self.lats[ring], self.lons[ring])]
+                )
+            if len(candidates) >= k:
+                best = k_smallest(distances, k)
+                if distances[best[-1]] <= self._lower_bound_km(lat, r):
+                    break
+
+        return [(float(distances[i]), int(self.ids[candidates[i]])) for i in best]
+
+
+_venue_index = None
+_venue_index_version = None
+_venue_index_lock = threading.Lock()
+
+# Shared stamp of the venue rows; every process rebuilds its grid once the
+# stamp moves. The cache must be shared (e.g. Redis) for writes made by other
+# processes, such as management commands or Celery, to reach the workers.
+VENUE_INDEX_VERSION_KEY = "venue_index:version"
+
+
+def venue_index_version():
+    version = cache.get(VENUE_INDEX_VERSION_KEY)
+    if version is None:
+        cache.add(VENUE_INDEX_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VENUE_INDEX_VERSION_KEY)
+    return version
+
+
+def get_venue_index():
+    """Return the process-local venue grid, rebuilt whenever the shared version moves."""
+    global _venue_index, _venue_index_version
+    # Read before the rows, so a write landing during the build bumps it past this value
+    version = venue_index_version()
+    index = _venue_index
+    if index is None or _venue_index_version != version:
+        with _venue_index_lock:
+            if _venue_index is None or _venue_index_version != version:
+                from .models import Venue
+
+                _venue_index = VenueGridIndex.from_queryset(
+                    Venue.objects.all(),
+                    cell_deg=getattr(settings, "VENUE_GRID_CELL_DEG", 0.25),
+                )
+                _venue_index_version = version
+            index = _venue_index
+    return index
+
+
+def invalidate_venue_index():
+    global _venue_index
+    with _venue_index_lock:
+        _venue_index = None
+    cache.set(VENUE_INDEX_VERSION_KEY, time.time_ns(), None)
+    # Again once committed: another process may have rebuilt from the old rows meanwhile
+    transaction.on_commit(lambda: cache.set(VENUE_INDEX_VERSION_KEY, time.time_ns(), None))
+
+
+def box_limits(lat, lon, radius_km):
+    """
+    Lat/lon rectangle enclosing a circle of `radius_km` around (lat, lon), as
+    (min_lat, max_lat, lon_ranges). lon_ranges is empty when every longitude
+    qualifies (the box reaches a pole) and holds two ranges when the box
+    crosses the antimeridian.
+    """
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = lat - dlat, lat + dlat
+    if min_lat <= -90 or max_lat >= 90:
+        return min_lat, max_lat, []
+
+    # Widest longitude span of the circle, reached at its edge latitude
+    s = math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(lat))
+    if s >= 1:
+        return min_lat, max_lat, []
+    dlon = math.degrees(math.asin(s))
+    min_lon, max_lon = lon - dlon, lon + dlon
+    if min_lon < -180:
+        return min_lat, max_lat, [(min_lon + 360, 180), (-180, max_lon)]
+    if max_lon > 180:
+        return min_lat, max_lat, [(min_lon, 180), (-180, max_lon - 360)]
+    return min_lat, max_lat, [(min_lon, max_lon)]
+
+
+def bounding_box(lat, lon, radius_km):
+    """Q filter for the box_limits() rectangle on latitude/longitude columns."""
+    min_lat, max_lat, lon_ranges = box_limits(lat, lon, radius_km)
+    q = Q(latitude__gte=min_lat, latitude__lte=max_lat)
+    if lon_ranges:
+        lon_q = Q()
+        for min_lon, max_lon in lon_ranges:
+            lon_q |= Q(longitude__gte=min_lon, longitude__lte=max_lon)
+        q &= lon_q
+    return q
+
+
+def nearest_in_queryset(queryset, lat, lon, k, radius_km=5.0, box=bounding_box):
+    """
+    Return up to k (distance_km, id) pairs from `queryset`, closest first.
+
+    Candidates are narrowed in the database with a bounding box that doubles
+    in size until it holds k rows whose k-th distance lies inside the box;
+    only those candidates are ranked exactly in Python. `box(lat, lon, radius_km)`
+    builds the Q filter for one box.
+    """
+    if k <= 0:
+        return []
+    max_radius = math.pi * EARTH_RADIUS_KM
+    while True:
+        rows = list(queryset.filter(box(lat, lon, radius_km)).values_list("id", "latitude", "longitude"))
+        if rows:
+            ids, lats, lons = (np.asarray(col) for col in zip(*rows))
+            distances = haversine_many(lat, lon, lats, lons)
+            best = k_smallest(distances, k)
+            if len(best) == k and distances[best[-1]] <= radius_km:
+                break
+        if radius_km >= max_radius:
+            break
+        radius_km = min(radius_km * 2, max_radius)
+
+    if not rows:
+        return []
+    return [(float(distances[i]), int(ids[i])) for i in best]
+
+
+def spatial_backend():
+    """
+    settings.SPATIAL_BACKEND: "grid" (in-memory index), "sql" (bounding-box
+    queries) or "rtree" (SQLite R*Tree tables, falls back to "sql" elsewhere).
+    """
+    backend = getattr(settings, "SPATIAL_BACKEND", "grid")
+    if backend == "rtree" and connection.vendor != "sqlite":
+        return "sql"
+    return backend
+
+
+def box_filter(model):
+    """The box(lat, lon, radius_km) filter matching the configured backend."""
+    if spatial_backend() == "rtree":
+        from . import rtree
+
+        return rtree.box_for(model)
+    return bounding_box
+
+
+def nearest_venues(lat, lon, k):
+    """
+    Return the k venues closest to (lat, lon) as a list of
+    (venue, distance_km) tuples ordered by distance.
+    """
+    from .models import Venue
+
+    if spatial_backend() == "grid":
+        hits = get_venue_index().nearest(lat, lon, k)
+    else:
+        hits = nearest_in_queryset(Venue.objects.all(), lat, lon, k, box=box_filter(Venue))
+    venues = Venue.objects.select_related("city").in_bulk([pk for _, pk in hits])
+    return [(venues[pk], distance) for distance, pk in hits if pk in venues]
+
+
+class Haversine(Func):
+    """
+    Great-circle distance in km between a fixed point and a pair of
+    latitude/longitude columns, evaluated by the database.
+
+    SQLite calls the HAVERSINE() function registered on every connection
+    (see register_sqlite_functions); other backends get plain SQL math.
+    """
+
+    function = "HAVERSINE"
+    arity = 4
+    output_field = FloatField()
+
+    def __init__(self, lat, lon, lat_field="latitude", lon_field="longitude", **extra):
+        super().__init__(Value(float(lat)), Value(float(lon)), F(lat_field), F(lon_field), **extra)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        (lat1, p_lat1), (lon1, p_lon1), (lat2, p_lat2), (lon2, p_lon2) = (
+            compiler.compile(expr) for expr in self.get_source_expressions()
+        )
+        sql = (
+            f"(2 * {EARTH_RADIUS_KM} * ASIN(LEAST(1.0, SQRT("
+            f"POWER(SIN(RADIANS({lat2} - {lat1}) / 2), 2) + "
+            f"COS(RADIANS({lat1})) * COS(RADIANS({lat2})) * "
+            f"POWER(SIN(RADIANS({lon2} - {lon1}) / 2), 2)))))"
+        )
+        params = (*p_lat2, *p_lat1, *p_lat1, *p_lat2, *p_lon2, *p_lon1)
+        return sql, params
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, **extra_context)
+
+
+def _sqlite_haversine(lat1, lon1, lat2, lon2):
+    if None in (lat1, lon1, lat2, lon2):
+        return None
+    return haversine(lat1, lon1, lat2, lon2)
+
+
+def register_sqlite_functions(connection):
+    connection.connection.create_function("HAVERSINE", 4, _sqlite_haversine, deterministic=True)
+
+
+def page_radius(queryset, lat, lon, k, start_km=None, radius_km=5.0, box=bounding_box):
+    """
+    Smallest radius, doubling from `radius_km`, within which the `_distance`
+    annotated `queryset` holds k rows farther than `start_km`; None when only
+    the whole sphere does. Every row of a distance-ordered page of k - 1 rows
+    after `start_km` then lies inside the box of that radius.
+    """
+    max_radius = math.pi * EARTH_RADIUS_KM
+    lower = {} if start_km is None else {"_distance__gt": start_km}
+    if start_km is not None:
+        radius_km = max(radius_km, 2 * start_km)
+    while radius_km < max_radius:
+        rows = queryset.order_by().filter(box(lat, lon, radius_km), _distance__lte=radius_km, **lower)
+        if rows.count() >= k:
+            return radius_km
+        radius_km *= 2
+    return None
+
+
+def _page_bounds(request):
+    """(rows needed, distance of the last row sent) for the request's page."""
+    from project.pagination import KeysetPagination
+
+    paginator = KeysetPagination()
+    cursor = paginator.decode_cursor(request)
+    try:
+        start = float(cursor[0]) if cursor else None
+    except (TypeError, ValueError):
+        # Left for the paginator to reject
+        start = None
+    return paginator.get_page_size(request) + 1, start
+
+
+def with_distance(queryset, request, lat_field="latitude", lon_field="longitude"):
+    """
+    Annotate `distance_km` from the request's ?lat=&lon= and order by it,
+    closest first. An optional ?radius= (km) keeps only rows within that
+    distance, prefiltered by the backend's bounding box. Without it the rtree
+    backend still narrows the sort to the box holding the requested page.
+    Returns the queryset untouched when neither lat nor lon is given.
+    """
+    lat = request.query_params.get("lat")
+    lon = request.query_params.get("lon")
+    if lat is None and lon is None:
+        return queryset
+    try:
+        lat, lon = float(lat), float(lon)
+        if not is_coordinate(lat, lon):
+            raise ValueError
+        radius = request.query_params.get("radius")
+        radius = float(radius) if radius is not None else None
+    except (TypeError, ValueError):
+        raise ValidationError({"error": "lat, lon and radius query parameters must be numbers"})
+
+    # _distance stays on the rows so keyset pagination can resume from it
+    queryset = queryset.annotate(_distance=Haversine(lat, lon, lat_field, lon_field))
+    if radius is not None:
+        queryset = queryset.filter(box_filter(queryset.model)(lat, lon, radius), _distance__lte=radius)
+    elif spatial_backend() == "rtree":
+        box = box_filter(queryset.model)
+        radius = page_radius(queryset, lat, lon, *_page_bounds(request), box=box)
+        if radius is not None:
+            queryset = queryset.filter(box(lat, lon, radius), _distance__lte=radius)
+    return queryset.annotate(distance_km=Round(F("_distance"), 2)).order_by("_distance", "id")
@@ -0,0 +1,78 @@
+"""
+Delta sync of the venue catalog.
+
+Clients send the cursor from their last sync and get back the rows whose
+update_at moved past it, plus tombstones for rows deleted since. The next
+cursor trails the server clock by SYNC_CURSOR_LAG so rows committed by
+transactions still open during a sync are picked up by the next one; rows
+near the cursor may therefore come back twice and must be applied as upserts.
+"""
+import base64
+import datetime
+import json
+
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .models import List_Message, NearByAttraction, ScavengerHunt, Stops, Tombstone, Venue
+
+SYNC_CURSOR_LAG = datetime.timedelta(seconds=10)
+
+# Response key of every synced model
+SYNC_MODELS = {
+    "venues": Venue,
+    "stops": Stops,
+    "scavenger_hunts": ScavengerHunt,
+    "messages": List_Message,
+    "nearby_attractions": NearByAttraction,
+}
+
+
+def tombstone_name(model):
+    return model._meta.model_name
+
+
+def encode_cursor(moment):
+    return base64.urlsafe_b64encode(json.dumps({"t": moment.isoformat()}).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Datetime held by a cursor; None (full sync) for an empty one."""
+    if not cursor:
+        return None
+    try:
+        moment = datetime.datetime.fromisoformat(json.loads(base64.urlsafe_b64decode(cursor.encode()))["t"])
+    except (TypeError, ValueError, KeyError):
+        raise ValidationError({"error": "Invalid since cursor"})
+    if timezone.is_naive(moment):
+        raise ValidationError({"error": "Invalid since cursor"})
+    return moment
+
+
+def changes_since(since):
+    """
+    Querysets of the rows changed after `since` and the ids deleted after it,
+    as ({key: queryset}, {key: [ids]}, next_cursor). Everything, and no
+    tombstones, when `since` is None.
+    """
+    next_cursor = encode_cursor(timezone.now() - SYNC_CURSOR_LAG)
+
+    changed = {}
+    for key, model in SYNC_MODELS.items():
+        queryset = model.objects.order_by("id")
+        if since is not None:
+            queryset = queryset.filter(update_at__gt=since)
+        changed[key] = queryset
+    changed["venues"] = changed["venues"].select_related("city", "type_of_place")
+
+    deleted = {key: [] for key in SYNC_MODELS}
+    if since is not None:
+        keys = {tombstone_name(model): key for key, model in SYNC_MODELS.items()}
+        tombstones = Tombstone.objects.filter(deleted_at__gt=since).order_by("id").values_list("model", "object_id")
+        for name, object_id in tombstones:
+            deleted[keys[name]].append(object_id)
+    return changed, deleted, next_cursor
+
+
+def record_deletion(instance):
+    Tombstone.objects.create(model=tombstone_name(type(instance)), object_id=instance.pk)
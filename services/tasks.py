@@ -0,0 +1,16 @@
+from celery import shared_task
+
+from .bundle import build_bundle
+from .images import build_derivatives
+
+
+@shared_task(ignore_result=True)
+def build_catalog_bundle():
+    bundle = build_bundle()
+    return {"version": bundle.version, "file": bundle.file.name, "size": bundle.size}
+
+
+@shared_task(ignore_result=True)
+def build_image_derivatives(names):
+    for name in names:
+        build_derivatives(name)
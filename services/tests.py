@@ -1,3 +1,1030 @@
-from django.test import TestCase
+import base64
+import datetime
+import decimal
+import gzip
+import json
+import shutil
+import tempfile
+import time
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from django.utils.http import http_date
+from django.utils.translation import gettext_lazy
+import numpy as np
+from PIL import Image
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from accounts.models import CustomUser
+from project.renderers import ORJSONParser, ORJSONRenderer
+from services import rtree
+from services.bundle import KEEP_BUNDLES, build_bundle
+from services.geofence import PRECISION_LEVELS, pack_polygon, simplify_polygon, unpack_polygon
+from services.images import DERIVATIVE_FORMATS, DERIVATIVE_SIZES, build_derivatives, derivative_name
+from services.importer import CatalogImporter
+from services.serializers import GeoFencedSerializer
+from services.models import CatalogBundle, City, GeoFenced, LatLng, List_Message, NearByAttraction, PlaceType, ScavengerHunt, Stops, UserScavengerHunt, Venue
+from services.signals import bulk_saved
+from services.spatial import VENUE_INDEX_VERSION_KEY, VenueGridIndex, box_limits, get_venue_index, nearest_venues
+from services.utils import EARTH_RADIUS_KM, haversine_many
+
+
+def make_catalog(venue_count, hunts_per_venue=3, suffix=""):
+    city, _ = City.objects.get_or_create(name="Dhaka")
+    place, _ = PlaceType.objects.get_or_create(name="Museum")
+    venues = []
+    for i in range(venue_count):
+        venue = Venue.objects.create(
+            city=city, type_of_place=place, venue_name=f"Venue {suffix}{i}",
+            latitude=23.8 + i * 0.01, longitude=90.4,
+        )
+        for j in range(hunts_per_venue):
+            ScavengerHunt.objects.create(venue=venue, title=f"Hunt {j}", latitude=23.8, longitude=90.4)
+        Stops.objects.create(Venue=venue, name="Stop", latitude=23.8, longitude=90.4)
+        List_Message.objects.create(venue=venue, message="Welcome")
+        venues.append(venue)
+    return venues
+
+
+class VenueGridIndexTests(TestCase):
+    def test_matches_brute_force(self):
+        rng = np.random.default_rng(7)
+        lats = np.concatenate([rng.uniform(-90, 90, 300), 23.8 + rng.normal(0, 0.2, 300), rng.uniform(85, 90, 20)])
+        lons = np.concatenate([rng.uniform(-180, 180, 300), 90.4 + rng.normal(0, 0.2, 300), rng.uniform(-180, 180, 20)])
+        ids = np.arange(len(lats))
+        index = VenueGridIndex(ids, lats, lons)
+        queries = [(40.7, -74.0), (-23.8, -89.6), (0.0, 179.9), (0.0, -179.9), (89.9, 0.0), (-90.0, 0.0)]
+        queries += list(zip(rng.uniform(-90, 90, 200), rng.uniform(-180, 180, 200)))
+        for lat, lon in queries:
+            expected = np.sort(haversine_many(lat, lon, lats, lons))[:10]
+            distances = [distance for distance, _ in index.nearest(lat, lon, 10)]
+            np.testing.assert_allclose(distances, expected)
+
+    def test_far_query_on_a_small_catalog(self):
+        index = VenueGridIndex([1, 2, 3], [23.8, 23.9, 24.0], [90.4, 90.5, 90.6])
+        self.assertEqual([pk for _, pk in index.nearest(-23.8, -89.6, 2)], [3, 2])
+        self.assertEqual(VenueGridIndex([], [], []).nearest(0, 0, 5), [])
+
+    def test_rebuilt_when_another_process_writes(self):
+        make_catalog(1)
+        index = get_venue_index()
+        self.assertIs(get_venue_index(), index)
+        # What a save in another process leaves behind: only the shared version moves
+        cache.set(VENUE_INDEX_VERSION_KEY, time.time_ns(), None)
+        rebuilt = get_venue_index()
+        self.assertIsNot(rebuilt, index)
+        self.assertEqual(rebuilt.size, 1)
+
+    def test_nearest_views_reject_bad_coordinates(self):
+        make_catalog(1, hunts_per_venue=0)
+        client = APIClient()
+        client.force_authenticate(CustomUser.objects.create_user("user@example.com", "User", "0100", password="x"))
+        for url in ["/api/services/nearest-venues/", "/api/services/nearest-venues/more/limit/"]:
+            for lat, lon in [("nan", "90.4"), ("23.8", "inf"), ("-inf", "0"), ("90.5", "0"), ("0", "-180.5")]:
+                response = client.get(url, {"lat": lat, "lon": lon})
+                self.assertEqual(response.status_code, 400, (url, lat, lon))
+            self.assertEqual(client.get(url, {"lat": 90, "lon": -180}).status_code, 200)
+        self.assertEqual(client.get("/api/services/venues/", {"lat": "nan", "lon": "90.4"}).status_code, 400)
+
+
+@override_settings(SPATIAL_BACKEND="sql")
+class BoundingBoxTests(TestCase):
+    def test_box_holds_the_circle(self):
+        rng = np.random.default_rng(11)
+        for lat, lon, radius in [(0, 179.9, 50), (0, -179.9, 50), (89.9, 0, 50), (-89.95, 100, 20), (60, 0, 300)]:
+            min_lat, max_lat, lon_ranges = box_limits(lat, lon, radius)
+            # Points on the circle itself, which the box must enclose
+            bearings = rng.uniform(0, 2 * np.pi, 500)
+            delta = radius / EARTH_RADIUS_KM
+            lat1, lon1 = np.radians(lat), np.radians(lon)
+            lats = np.arcsin(np.sin(lat1) * np.cos(delta) + np.cos(lat1) * np.sin(delta) * np.cos(bearings))
+            lons = lon1 + np.arctan2(
+                np.sin(bearings) * np.sin(delta) * np.cos(lat1), np.cos(delta) - np.sin(lat1) * np.sin(lats)
+            )
+            lats, lons = np.degrees(lats), (np.degrees(lons) + 540) % 360 - 180
+            self.assertTrue(((lats >= min_lat - 1e-9) & (lats <= max_lat + 1e-9)).all())
+            if lon_ranges:
+                inside = np.zeros(len(lons), dtype=bool)
+                for low, high in lon_ranges:
+                    inside |= (lons >= low - 1e-9) & (lons <= high + 1e-9)
+                self.assertTrue(inside.all(), (lat, lon))
+
+        self.assertEqual(len(box_limits(0, 179.9, 50)[2]), 2)
+        self.assertEqual(len(box_limits(0, -179.9, 50)[2]), 2)
+        self.assertEqual(box_limits(89.9, 0, 50)[2], [])
+
+    def test_nearest_matches_brute_force(self):
+        rng = np.random.default_rng(13)
+        lats = np.concatenate([rng.uniform(-90, 90, 150), rng.uniform(-3, 3, 40), rng.uniform(86, 90, 20)])
+        lons = np.concatenate([rng.uniform(-180, 180, 150), rng.choice([-1, 1], 40) * rng.uniform(178, 180, 40),
+                               rng.uniform(-180, 180, 20)])
+        city = City.objects.create(name="Anywhere")
+        place = PlaceType.objects.create(name="Park")
+        venues = Venue.objects.bulk_create(
+            Venue(city=city, type_of_place=place, venue_name=f"Venue {i}", latitude=lat, longitude=lon)
+            for i, (lat, lon) in enumerate(zip(lats.tolist(), lons.tolist()))
+        )
+        ids = np.array([venue.id for venue in venues])
+        for lat, lon in [(0, 179.9), (0, -179.9), (1, 180), (89.9, 0), (-89.95, 100), (23.8, 90.4), (-60, -45)]:
+            distances = haversine_many(lat, lon, lats, lons)
+            order = np.argsort(distances, kind="stable")[:8]
+            found = nearest_venues(lat, lon, 8)
+            np.testing.assert_allclose([distance for _, distance in found], distances[order])
+            self.assertEqual({venue.id for venue, _ in found}, set(ids[order].tolist()), (lat, lon))
+
+
+@override_settings(SPATIAL_BACKEND="rtree")
+class RTreeTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def indexed(self, model):
+        rtree.ensure_tables()
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT id, min_lat, min_lon FROM "{rtree.rtree_table(model)}" ORDER BY id')
+            return cursor.fetchall()
+
+    def attractions(self, points):
+        return NearByAttraction.objects.bulk_create(
+            NearByAttraction(title=f"Attraction {i}", category="Parks", latitude=lat, longitude=lon)
+            for i, (lat, lon) in enumerate(points)
+        )
+
+    def test_signals_keep_the_table_in_sync(self):
+        venue = make_catalog(1, hunts_per_venue=0)[0]
+        self.assertEqual([pk for pk, _, _ in self.indexed(Venue)], [venue.id])
+
+        venue.latitude = 10.5
+        venue.save()
+        [(_, lat, _)] = self.indexed(Venue)
+        self.assertAlmostEqual(lat, 10.5, places=4)
+
+        venue.delete()
+        self.assertEqual(self.indexed(Venue), [])
+
+    def test_bulk_saved_upserts_many(self):
+        self.assertEqual(self.indexed(NearByAttraction), [])
+        # bulk_create sends no signals and keeps the raw string input
+        rows = self.attractions([("12.5", "45.25"), ("-33.9", "151.2")])
+        self.assertEqual(self.indexed(NearByAttraction), [])
+        bulk_saved(NearByAttraction, rows)
+        indexed = self.indexed(NearByAttraction)
+        self.assertEqual([pk for pk, _, _ in indexed], [row.id for row in rows])
+        np.testing.assert_allclose([(lat, lon) for _, lat, lon in indexed], [(12.5, 45.25), (-33.9, 151.2)], atol=1e-4)
+
+    def test_rebuild_command(self):
+        venues = make_catalog(2, hunts_per_venue=0)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM "{rtree.rtree_table(Venue)}"')
+        out = StringIO()
+        call_command("rebuild_rtree", stdout=out)
+        self.assertIn("Venue: 2 row(s) indexed", out.getvalue())
+        self.assertEqual([pk for pk, _, _ in self.indexed(Venue)], [v.id for v in venues])
+
+    def test_tables_from_a_rolled_back_write_are_recreated(self):
+        with connection.cursor() as cursor:
+            for model in rtree.RTREE_MODELS:
+                cursor.execute(f'DROP TABLE IF EXISTS "{rtree.rtree_table(model)}"')
+        rtree._ready.clear()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            make_catalog(1, hunts_per_venue=0)
+            raise IntegrityError
+        self.assertNotIn(rtree.rtree_table(Venue), connection.introspection.table_names())
+        self.assertEqual(rtree._ready, set())
+
+        venue = make_catalog(1, hunts_per_venue=0, suffix="b")[0]
+        self.assertEqual([pk for pk, _, _ in self.indexed(Venue)], [venue.id])
+
+    def test_distance_queries_match_brute_force(self):
+        rng = np.random.default_rng(3)
+        lats, lons = 23.8 + rng.normal(0, 2, 60), 90.4 + rng.normal(0, 2, 60)
+        rows = self.attractions(zip(lats, lons))
+        bulk_saved(NearByAttraction, rows)
+        distances = haversine_many(23.8, 90.4, lats, lons)
+        expected = [rows[i].id for i in np.argsort(distances, kind="stable")]
+
+        body = self.client.get("/api/services/nearby-attractions/", {"lat": 23.8, "lon": 90.4, "radius": 150}).json()
+        self.assertEqual([row["id"] for row in body["results"]], expected[:int((distances <= 150).sum())])
+
+        # Without a radius each page is still cut down to the box that holds
+        # it; only the last one, with fewer rows left than a page, scans
+        ids, url = [], "/api/services/nearby-attractions/?lat=23.8&lon=90.4&page_size=7"
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                body = self.client.get(url).json()
+            ids += [row["id"] for row in body["results"]]
+            url = body["next"]
+            if url:
+                self.assertIn("_rtree", queries.captured_queries[-1]["sql"])
+        self.assertEqual(ids, expected)
+
+
+class GeofenceTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(CustomUser.objects.create_user("user@example.com", "User", "0100", password="x"))
+        # Square around (23.8, 90.4)
+        self.fence = GeoFenced.objects.create(
+            title="Old town", polygon=pack_polygon([23.7, 23.7, 23.9, 23.9], [90.3, 90.5, 90.5, 90.3])
+        )
+        # The list snapshot lives in the cache, which outlives each test's rows
+        cache.clear()
+
+    def snapshot(self, **headers):
+        return self.client.get("/api/services/geofences/", headers=headers)
+
+    def expire_after(self, write):
+        # Only the snapshot expiry; the other on_commit callbacks need a broker
+        with self.captureOnCommitCallbacks() as callbacks:
+            write()
+        for callback in callbacks:
+            if callback.__qualname__.startswith("expire_snapshot"):
+                callback()
+
+    def check(self, lat, lon):
+        body = self.client.get("/api/services/geofences/check/", {"lat": lat, "lon": lon}).json()
+        return [fence["id"] for fence in body["geofences"]]
+
+    def events(self, points, inside=()):
+        pings = [
+            {"latitude": lat, "longitude": lon, "timestamp": f"2026-01-01T00:00:{i:02d}Z"}
+            for i, (lat, lon) in enumerate(points)
+        ]
+        return self.client.post(
+            "/api/services/geofences/events/", {"pings": pings, "inside": list(inside)}, format="json"
+        ).json()
+
+    def test_containing_follows_orm_writes(self):
+        self.assertEqual(self.check(23.8, 90.4), [self.fence.id])
+        self.assertEqual(self.check(24.5, 90.4), [])
+
+        # Edits outside the serializer reach the index through the signals
+        self.fence.polygon = pack_polygon([24.4, 24.4, 24.6, 24.6], [90.3, 90.5, 90.5, 90.3])
+        self.fence.save()
+        self.assertEqual(self.check(23.8, 90.4), [])
+        self.assertEqual(self.check(24.5, 90.4), [self.fence.id])
+
+        legacy = GeoFenced.objects.create(title="Legacy")
+        for lat, lon in [(10, 10), (10, 11), (11, 11), (11, 10)]:
+            LatLng.objects.create(geo_fenced_area=legacy, latitude=lat, longitude=lon)
+        self.assertEqual(self.check(10.5, 10.5), [legacy.id])
+
+    def test_inside_carries_over_between_batches(self):
+        first = self.events([(24.5, 90.4), (23.8, 90.4), (23.85, 90.45)])
+        self.assertEqual([(e["event"], e["geofence"]["id"]) for e in first["events"]], [("enter", self.fence.id)])
+        self.assertEqual(first["inside"], [self.fence.id])
+
+        # Still inside at the start of the next batch: no second enter, only the exit
+        second = self.events([(23.8, 90.41), (25.0, 90.4)], inside=first["inside"])
+        self.assertEqual([(e["event"], e["latitude"]) for e in second["events"]], [("exit", 25.0)])
+        self.assertEqual(second["inside"], [])
+
+        # Without the carried state the client would see a spurious enter
+        fresh = self.events([(23.8, 90.41), (25.0, 90.4)])
+        self.assertEqual([e["event"] for e in fresh["events"]], ["enter", "exit"])
+
+    def test_check_rejects_bad_coordinates(self):
+        for lat, lon in [("nan", "90.4"), ("23.8", "inf"), ("-inf", "nan"), ("91", "90.4"), ("23.8", "181")]:
+            response = self.client.get("/api/services/geofences/check/", {"lat": lat, "lon": lon})
+            self.assertEqual(response.status_code, 400, (lat, lon))
+
+    def test_snapshot_answers_matching_etag_without_queries(self):
+        etag = self.snapshot()["ETag"]
+        with self.assertNumQueries(0):
+            response = self.snapshot(if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_snapshot_version_moves_on_writes(self):
+        etag = self.snapshot()["ETag"]
+        self.fence.title = "New town"
+        self.expire_after(self.fence.save)
+        response = self.snapshot(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]["title"], "New town")
+
+        etag = response["ETag"]
+        self.expire_after(lambda: LatLng.objects.create(geo_fenced_area=self.fence, latitude=23.8, longitude=90.4))
+        self.assertNotEqual(self.snapshot(if_none_match=etag)["ETag"], etag)
+
+    def test_snapshot_is_gzipped_only_when_accepted(self):
+        zipped = self.snapshot(accept_encoding="gzip, deflate")
+        plain = self.snapshot()
+        self.assertEqual(zipped["Content-Encoding"], "gzip")
+        self.assertNotIn("Content-Encoding", plain)
+        self.assertIn("Accept-Encoding", zipped["Vary"])
+        self.assertEqual(json.loads(gzip.decompress(zipped.content)), plain.json())
+        self.assertEqual([fence["title"] for fence in plain.json()], ["Old town"])
+
+    def test_precision_is_part_of_the_etag(self):
+        etags = {
+            self.client.get("/api/services/geofences/", {"precision": precision})["ETag"]
+            for precision in ["full", "medium", "low"]
+        }
+        self.assertEqual(len(etags), 3)
+        full = self.snapshot()["ETag"]
+        response = self.client.get("/api/services/geofences/", {"precision": "low"}, headers={"if_none_match": full})
+        self.assertEqual(response.status_code, 200)
+
+
+def noisy_circle(n=400, seed=5):
+    """Ring of n vertices 0.05 deg around (23.8, 90.4) with ~30 m of jitter."""
+    rng = np.random.default_rng(seed)
+    angles = np.linspace(0, 2 * np.pi, n, endpoint=False)
+    radius = 0.05 + rng.normal(0, 0.0003, n)
+    return 23.8 + radius * np.sin(angles), 90.4 + radius * np.cos(angles)
+
+
+class SimplifyPolygonTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        self.lats, self.lons = noisy_circle()
+        self.points = [{"latitude": lat, "longitude": lon} for lat, lon in zip(self.lats.tolist(), self.lons.tolist())]
+
+    def save(self, data, instance=None):
+        serializer = GeoFencedSerializer(instance, data=data, partial=instance is not None)
+        serializer.is_valid(raise_exception=True)
+        fence = serializer.save()
+        fence.refresh_from_db()
+        return fence
+
+    def test_each_level_drops_vertices(self):
+        medium, _ = simplify_polygon(self.lats, self.lons, PRECISION_LEVELS["medium"])
+        low, _ = simplify_polygon(self.lats, self.lons, PRECISION_LEVELS["low"])
+        self.assertGreater(len(self.lats), len(medium))
+        self.assertGreater(len(medium), len(low))
+        # Simplified rings keep a subset of the original vertices, in order
+        self.assertTrue(np.isin(low, medium).all() and np.isin(medium, self.lats).all())
+
+    def test_never_below_four_vertices(self):
+        square = ([23.7, 23.7, 23.9, 23.9], [90.3, 90.5, 90.5, 90.3])
+        sliver = ([0, 0, 1e-6, 1, 1, 1e-6], [0, 1, 2, 1, 0, -1])
+        for lats, lons in [(self.lats, self.lons), square, sliver]:
+            for tolerance in [1e-5, 1e-3, 0.1, 10]:
+                self.assertGreaterEqual(len(simplify_polygon(lats, lons, tolerance)[0]), 4, tolerance)
+
+    def test_serializer_recomputes_simplified(self):
+        fence = self.save({"title": "Circle", "polygon_points": self.points})
+        self.assertEqual(set(fence.simplified), set(PRECISION_LEVELS))
+        lats, lons = simplify_polygon(self.lats, self.lons, PRECISION_LEVELS["low"])
+        np.testing.assert_allclose(fence.simplified["low"], np.column_stack([lats, lons]))
+
+        square = [{"latitude": lat, "longitude": lon} for lat, lon in [(1, 1), (1, 2), (2, 2), (2, 1)]]
+        fence = self.save({"polygon_points": square}, instance=fence)
+        self.assertEqual(fence.simplified["low"], [[1, 1], [1, 2], [2, 2], [2, 1]])
+        # Edits that leave the polygon alone keep the stored copies
+        self.assertEqual(self.save({"title": "Square"}, instance=fence).simplified, fence.simplified)
+
+    def test_list_serves_the_stored_copy(self):
+        fence = self.save({"title": "Circle", "polygon_points": self.points})
+        stored = [[1.0, 1.0], [1.0, 2.0], [2.0, 2.0], [2.0, 1.0]]
+        GeoFenced.objects.filter(pk=fence.pk).update(simplified={**fence.simplified, "low": stored})
+        cache.clear()
+
+        def polygon(precision):
+            response = self.client.get("/api/services/geofences/", {"precision": precision})
+            return [[p["latitude"], p["longitude"]] for p in response.json()[0]["polygon_points"]]
+
+        self.assertEqual(polygon("low"), stored)
+        self.assertEqual(polygon("medium"), fence.simplified["medium"])
+        self.assertEqual(len(polygon("full")), len(self.points))
+        response = self.client.get("/api/services/geofences/", {"precision": "ultra"})
+        self.assertEqual(response.status_code, 400)
+
+
+class PolygonStorageTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(CustomUser.objects.create_superuser("admin@example.com", "Admin", "0100", password="x"))
+        cache.clear()
+
+    def test_polygon_points_round_trip(self):
+        points = [{"latitude": lat, "longitude": lon} for lat, lon in [(23.7, 90.3), (23.7, 90.5), (23.9, 90.5), (23.9, 90.3)]]
+        response = self.client.post("/api/services/geofences/", {"title": "Old town", "polygon_points": points}, format="json")
+        self.assertEqual(response.json()["polygon_points"], points)
+        fence = GeoFenced.objects.get()
+        # Stored packed, without LatLng rows
+        self.assertFalse(fence.polygon_points.exists())
+        url = f"/api/services/geofences/{fence.id}/"
+        self.assertEqual(self.client.get(url).json()["polygon_points"], points)
+
+        moved = [{"latitude": p["latitude"] + 1, "longitude": p["longitude"]} for p in points]
+        moved.append({"latitude": 24.8, "longitude": 90.4})
+        self.assertEqual(self.client.patch(url, {"polygon_points": moved}, format="json").json()["polygon_points"], moved)
+        self.assertEqual(self.client.get(url).json()["polygon_points"], moved)
+        self.assertEqual(self.client.get("/api/services/geofences/").json()[0]["polygon_points"], moved)
+
+        response = self.client.patch(url, {"polygon_points": moved[:3]}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_pack_command_moves_legacy_points(self):
+        corners = [(10.0, 10.0), (10.0, 11.0), (11.0, 11.0), (11.0, 10.0)]
+        legacy = GeoFenced.objects.create(title="Legacy")
+        for lat, lon in corners:
+            LatLng.objects.create(geo_fenced_area=legacy, latitude=lat, longitude=lon)
+        unsimplified = GeoFenced.objects.create(title="Packed", polygon=pack_polygon(*zip(*corners)))
+        url = f"/api/services/geofences/{legacy.id}/"
+        before = self.client.get(url).json()["polygon_points"]
+
+        out = StringIO()
+        call_command("pack_geofence_polygons", stdout=out)
+        self.assertIn("Packed 1 geofence polygon(s), simplified 1 more.", out.getvalue())
+        self.assertFalse(LatLng.objects.exists())
+        legacy.refresh_from_db()
+        unsimplified.refresh_from_db()
+        lats, lons = unpack_polygon(legacy.polygon)
+        self.assertEqual(list(zip(lats.tolist(), lons.tolist())), corners)
+        self.assertEqual(set(legacy.simplified), set(PRECISION_LEVELS))
+        self.assertEqual(set(unsimplified.simplified), set(PRECISION_LEVELS))
+        self.assertEqual(self.client.get(url).json()["polygon_points"], before)
+
+
+class HuntProgressQueryTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("user@example.com", "User", "0100", password="x", is_active=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def progress_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        # rows loaded for serialization, not the conditional GET validator
+        select = f'SELECT "{UserScavengerHunt._meta.db_table}".'
+        return response, [q for q in ctx.captured_queries if q["sql"].startswith(select)]
+
+    def test_venue_lists_load_progress_once(self):
+        for url in ["/api/services/venues/", "/api/services/venues/admin/", "/api/services/places/venue/"]:
+            with self.subTest(url=url):
+                make_catalog(2, suffix=f"{url}-a")
+                _, small = self.progress_queries(url)
+                make_catalog(4, suffix=f"{url}-b")
+                _, large = self.progress_queries(url)
+                self.assertEqual(len(small), 1)
+                self.assertEqual(len(large), 1)
+
+    def test_check_reflects_user_progress(self):
+        venue = make_catalog(1)[0]
+        hunt = venue.scavenger_hunts.first()
+        UserScavengerHunt.objects.create(user=self.user, scavenger_hunt=hunt, checked=True)
+
+        response, _ = self.progress_queries("/api/services/venues/")
+        checks = {h["id"]: h["check"]["checked"] for h in response.json()["results"][0]["scavenger_hunts"]}
+        self.assertTrue(checks[hunt.id])
+        self.assertEqual(sum(checks.values()), 1)
+
+
+class QueryBudgetMixin:
+    """
+    Fails when a GET runs more queries than its view's `query_budget`.
+
+    Views on the hot read paths declare `query_budget = N`, the most queries
+    one GET of theirs may run. Tests call assertWithinQueryBudget() for each
+    such URL, so a change that brings back a per-row query fails here
+    instead of in production.
+    """
+
+    def assertWithinQueryBudget(self, url):
+        budget = resolve(url.split("?")[0]).func.view_class.query_budget
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(
+            len(ctx), budget,
+            f"{url} ran {len(ctx)} queries, budget is {budget}:\n"
+            + "\n".join(q["sql"] for q in ctx.captured_queries),
+        )
+        return response
+
+
+class VenueQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("user@example.com", "User", "0100", password="x", is_active=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_venue_read_paths(self):
+        for size in (1, 5):
+            venues = make_catalog(size, suffix=f"{size}-")
+            city_id = venues[0].city_id
+            for url in [
+                "/api/services/venues/",
+                "/api/services/venues/?page_size=3&lat=23.8&lon=90.4",
+                "/api/services/venues/admin/",
+                f"/api/services/venues/city/{city_id}/",
+                f"/api/services/venues/{venues[0].id}/",
+                "/api/services/places/venue/",
+                "/api/services/cities/venues/",
+            ]:
+                with self.subTest(url=url, size=size):
+                    self.assertWithinQueryBudget(url)
+
+    def test_grouped_endpoints_keep_top_venues(self):
+        other = City.objects.create(name="Sylhet")
+        venues = make_catalog(4, hunts_per_venue=0)
+        Venue.objects.filter(pk=venues[3].pk).update(city=other)
+
+        response = self.assertWithinQueryBudget("/api/services/cities/venues/")
+        by_city = {c["name"]: [v["id"] for v in c["venues"]] for c in response.json()["results"]}
+        self.assertEqual(by_city, {"Dhaka": [venues[0].id, venues[1].id], "Sylhet": [venues[3].id]})
+
+        make_catalog(3, hunts_per_venue=0, suffix="more-")
+        response = self.assertWithinQueryBudget("/api/services/places/venue/")
+        self.assertEqual(len(response.json()["Museum"]), 5)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def collect(self, url):
+        ids = []
+        while url:
+            body = self.client.get(url).json()
+            ids += [row["id"] for row in body["results"]]
+            url = body["next"]
+        return ids
+
+    def test_pages_cover_every_row_once(self):
+        venues = make_catalog(7, hunts_per_venue=0)
+        self.assertEqual(self.collect("/api/services/venues/?page_size=3"), [v.id for v in venues])
+
+    def test_distance_order_is_kept_across_pages(self):
+        venues = make_catalog(5, hunts_per_venue=0)
+        ids = self.collect("/api/services/venues/?page_size=2&lat=23.9&lon=90.4")
+        self.assertEqual(ids, [v.id for v in reversed(venues)])
+
+    def test_invalid_cursor(self):
+        make_catalog(1, hunts_per_venue=0)
+        # Not base64 JSON, a number, a list of the wrong values, the wrong length
+        cursors = ["not-a-cursor", "MQ==", "WzEsMl0=", base64.urlsafe_b64encode(b'["x", "y"]').decode(), "WzFd"]
+        for cursor in cursors:
+            response = self.client.get("/api/services/venues/", {"cursor": cursor})
+            self.assertEqual(response.status_code, 404, cursor)
+
+
+class SparseFieldsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), " ".join(q["sql"] for q in ctx.captured_queries)
+
+    def test_fields_skip_unrendered_relations(self):
+        make_catalog(3)
+        body, sql = self.get("/api/services/venues/?fields=id,venue_name,latitude,longitude")
+        self.assertEqual(set(body["results"][0]), {"id", "venue_name", "latitude", "longitude"})
+        for model in (City, ScavengerHunt, Stops, List_Message):
+            self.assertNotIn(model._meta.db_table, sql)
+
+    def test_expand_limits_nested_relations(self):
+        premium, plain = make_catalog(2)
+        plain.scavenger_hunts.all().delete()
+        body, sql = self.get("/api/services/venues/admin/?expand=stops")
+        self.assertNotIn(List_Message._meta.db_table, sql)
+        row = body["results"][0]
+        self.assertIn("stops", row)
+        self.assertNotIn("scavenger_hunts", row)
+        self.assertNotIn("venue_message", row)
+
+        body, _ = self.get("/api/services/venues/?fields=id,is_premium,stops&expand=stops")
+        rows = {row["id"]: row for row in body["results"]}
+        self.assertEqual(rows[premium.id], {"id": premium.id, "is_premium": True})
+        self.assertTrue(rows[plain.id]["stops"])
+        self.assertFalse(rows[plain.id]["is_premium"])
+
+    def test_unknown_field(self):
+        response = self.client.get("/api/services/venues/?fields=id,secret")
+        self.assertEqual(response.status_code, 400)
+
+
+class ORJSONRendererTests(TestCase):
+    def test_matches_drf_renderer(self):
+        data = {
+            "at": datetime.datetime(2025, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc),
+            "local": timezone.localtime(timezone.now()),
+            "day": datetime.date(2025, 1, 2),
+            "price": decimal.Decimal("12.50"),
+            "label": gettext_lazy("Museum"),
+            "nested": [{"id": 1, "distance_km": 0.25}],
+        }
+        expected = json.loads(JSONRenderer().render(data))
+        self.assertEqual(json.loads(ORJSONRenderer().render(data)), expected)
+        self.assertEqual(ORJSONRenderer().render(None), b"")
+
+    def test_parser_round_trip(self):
+        body = ORJSONRenderer().render({"name": "Dhaka", "ids": [1, 2]})
+        self.assertEqual(ORJSONParser().parse(BytesIO(body)), {"name": "Dhaka", "ids": [1, 2]})
+        with self.assertRaises(ParseError):
+            ORJSONParser().parse(BytesIO(b"{not json"))
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), len(ctx)
+
+    def test_hits_until_a_model_it_reads_changes(self):
+        venue = make_catalog(2, hunts_per_venue=0)[0]
+        # A hit only runs the conditional GET validator query
+        first, _ = self.queries("/api/services/stops/list/")
+        self.assertEqual(self.queries("/api/services/stops/list/"), (first, 1))
+        self.queries("/api/services/cities/")
+
+        Stops.objects.create(Venue=venue, name="New stop", latitude=23.8, longitude=90.4)
+        body, count = self.queries("/api/services/stops/list/")
+        self.assertGreater(count, 1)
+        self.assertEqual(len(body["results"][0]["stops"]), 2)
+        # Cities don't read stops, so their entry survives
+        self.assertEqual(self.queries("/api/services/cities/")[1], 1)
+
+    def test_query_string_is_part_of_the_key(self):
+        make_catalog(3, hunts_per_venue=0)
+        near, _ = self.queries("/api/services/venues/?lat=23.9&lon=90.4")
+        plain, _ = self.queries("/api/services/venues/")
+        self.assertNotEqual(near["results"][0]["id"], plain["results"][0]["id"])
+
+    def test_authenticated_users_skip_per_user_responses(self):
+        make_catalog(1)
+        self.queries("/api/services/venues/")
+        self.client.force_authenticate(CustomUser.objects.create_user("u@example.com", "U", "0100", password="x"))
+        self.assertGreater(self.queries("/api/services/venues/")[1], 1)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def get(self, url, **headers):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, headers=headers)
+        return response, len(ctx)
+
+    def test_unchanged_list_costs_one_query(self):
+        make_catalog(3)
+        for url in ["/api/services/venues/", "/api/services/stops/list/", "/api/services/cities/"]:
+            with self.subTest(url=url):
+                response, _ = self.get(url)
+                self.assertEqual(response.status_code, 200)
+                response, count = self.get(url, if_none_match=response["ETag"])
+                self.assertEqual((response.status_code, count), (304, 1))
+                self.assertFalse(response.content)
+
+    def test_delete_is_not_hidden_by_if_modified_since(self):
+        make_catalog(3)
+        url = "/api/services/stops/list/"
+        response, _ = self.get(url)
+        etag, stops = response["ETag"], len(response.json()["results"])
+        self.assertNotIn("Last-Modified", response)
+
+        # A delete leaves max(update_at) where it was; only the ETag sees it
+        Stops.objects.order_by("id").first().delete()
+        since = http_date(time.time() + 60)
+        response, _ = self.get(url, if_modified_since=since)
+        self.assertEqual((response.status_code, len(response.json()["results"])), (200, stops - 1))
+        response, _ = self.get(url, if_none_match=etag, if_modified_since=since)
+        self.assertEqual(response.status_code, 200)
+
+    def test_nested_changes_invalidate(self):
+        venue = make_catalog(2)[0]
+        etag = self.get("/api/services/venues/")[0]["ETag"]
+
+        venue.scavenger_hunts.first().delete()
+        response, _ = self.get("/api/services/venues/", if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+        etag = response["ETag"]
+        List_Message.objects.filter(venue=venue).update(message="Changed", update_at=timezone.now())
+        self.assertEqual(self.get("/api/services/venues/", if_none_match=etag)[0].status_code, 200)
+
+    def test_unrendered_relations_are_ignored(self):
+        venue = make_catalog(1)[0]
+        url = "/api/services/venues/?fields=id,venue_name"
+        etag = self.get(url)[0]["ETag"]
+        Stops.objects.create(Venue=venue, name="Another", latitude=23.8, longitude=90.4)
+        self.assertEqual(self.get(url, if_none_match=etag)[0].status_code, 304)
+
+
+class CatalogSyncTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def sync(self, cursor=None):
+        response = self.client.get("/api/services/sync/", {"since": cursor} if cursor else {})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_returns_changes_and_tombstones_since_cursor(self):
+        kept, dropped = make_catalog(2)
+        # Age the rows so they sit well before the cursor's lag window
+        for model in (Venue, ScavengerHunt, Stops, List_Message):
+            model.objects.update(update_at=timezone.now() - datetime.timedelta(hours=1))
+        first = self.sync()
+        self.assertEqual({v["id"] for v in first["venues"]}, {kept.id, dropped.id})
+        self.assertEqual(len(first["scavenger_hunts"]), 6)
+        cursor = first["cursor"]
+
+        hunt = kept.scavenger_hunts.first()
+        hunt.title = "Renamed"
+        hunt.save()
+        dropped_id, stop_ids = dropped.id, list(dropped.stops.values_list("id", flat=True))
+        dropped.delete()
+
+        delta = self.sync(cursor)
+        self.assertEqual(delta["venues"], [])
+        self.assertEqual([h["title"] for h in delta["scavenger_hunts"]], ["Renamed"])
+        self.assertEqual(delta["deleted"]["venues"], [dropped_id])
+        self.assertEqual(delta["deleted"]["stops"], stop_ids)
+        self.assertEqual(len(delta["deleted"]["scavenger_hunts"]), 3)
+        self.assertTrue(delta["cursor"])
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/api/services/sync/", {"since": "garbage"})
+        self.assertEqual(response.status_code, 400)
+
+
+class CatalogBundleTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        settings = override_settings(MEDIA_ROOT=self.media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client = APIClient()
+
+    def test_endpoint_points_at_latest_bundle(self):
+        self.assertEqual(self.client.get("/api/services/sync/bundle/").status_code, 404)
+
+        make_catalog(2)
+        bundle = build_bundle()
+        body = self.client.get("/api/services/sync/bundle/").json()
+        self.assertEqual(body["version"], bundle.version)
+        self.assertTrue(body["url"].endswith(bundle.file.url))
+
+        with bundle.file.open("rb") as f:
+            catalog = json.loads(gzip.decompress(f.read()))
+        self.assertEqual(len(catalog["venues"]), 2)
+        self.assertEqual(len(catalog["scavenger_hunts"]), 6)
+        self.assertEqual(catalog["cities"][0]["name"], "Dhaka")
+        self.assertIn("geofences", catalog)
+        # The bundle's cursor continues with the sync endpoint
+        self.assertEqual(self.client.get("/api/services/sync/", {"since": catalog["cursor"]}).status_code, 200)
+
+    def test_old_bundles_are_pruned(self):
+        versions = [build_bundle().version for _ in range(KEEP_BUNDLES + 2)]
+        self.assertEqual(versions, sorted(set(versions)))
+        kept = CatalogBundle.objects.order_by("version")
+        self.assertEqual([b.version for b in kept], versions[-KEEP_BUNDLES:])
+
+
+class CreateVenueWriteTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.city = City.objects.create(name="Dhaka")
+        self.place = PlaceType.objects.create(name="Museum")
+
+    def payload(self, hunts, stops):
+        data = {"city": self.city.id, "type_of_place": self.place.id, "venue_name": "Big venue",
+                "latitude": "23.8", "longitude": "90.4", "venue_message[0][message]": "Welcome"}
+        for i in range(hunts):
+            data[f"scavenger_hunts[{i}][title]"] = f"Hunt {i}"
+        for i in range(stops):
+            data.update({f"stops[{i}][name]": f"Stop {i}", f"stops[{i}][latitude]": "23.8", f"stops[{i}][longitude]": "90.4"})
+        return data
+
+    def test_children_are_inserted_in_bulk(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post("/api/services/venues/create/", self.payload(20, 30), format="multipart")
+        self.assertEqual(response.status_code, 201)
+        venue = Venue.objects.get(venue_name="Big venue")
+        self.assertEqual((venue.scavenger_hunts.count(), venue.stops.count(), venue.messages.count()), (20, 30, 1))
+        inserts = [q for q in ctx.captured_queries if q["sql"].startswith("INSERT")]
+        self.assertEqual(len(inserts), 4)
+
+    def test_bad_stop_is_rejected_before_writing(self):
+        data = self.payload(2, 2)
+        data["stops[1][latitude]"] = "north"
+        response = self.client.post("/api/services/venues/create/", data, format="multipart")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"stops": ["latitude must be a number."]})
+        self.assertFalse(Venue.objects.filter(venue_name="Big venue").exists())
+        self.assertFalse(ScavengerHunt.objects.exists())
+
+
+    def test_sparse_indexes_are_compacted(self):
+        data = self.payload(0, 0)
+        data.update({"stops[7][name]": "Last", "stops[7][latitude]": "23.8", "stops[7][longitude]": "90.4",
+                     "stops[3][name]": "First", "stops[3][latitude]": "23.8", "stops[3][longitude]": "90.4"})
+        response = self.client.post("/api/services/venues/create/", data, format="multipart")
+        self.assertEqual(response.status_code, 201)
+        venue = Venue.objects.get(venue_name="Big venue")
+        self.assertEqual(sorted(venue.stops.values_list("name", flat=True)), ["First", "Last"])
+
+    def test_huge_index_is_rejected(self):
+        data = self.payload(1, 0)
+        data["stops[999999][name]"] = "Far away"
+        response = self.client.post("/api/services/venues/create/", data, format="multipart")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("stops", response.json())
+        self.assertFalse(Venue.objects.exists())
+
+class UpdateVenueWriteTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.venue = make_catalog(1)[0]
+        self.hunts = list(self.venue.scavenger_hunts.order_by("id"))
+        self.user = CustomUser.objects.create_user("user@example.com", "User", "0100", password="x")
+        UserScavengerHunt.objects.create(user=self.user, scavenger_hunt=self.hunts[0], checked=True)
+
+    def patch(self, data):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.patch(f"/api/services/venues/update/{self.venue.id}/", data, format="multipart")
+        return response, [" ".join(q["sql"].split()[:3]) for q in ctx.captured_queries]
+
+    def test_only_changed_rows_are_written(self):
+        first, second, third = self.hunts
+        response, statements = self.patch({
+            "scavenger_hunts[0][id]": first.id, "scavenger_hunts[0][title]": first.title,
+            "scavenger_hunts[1][id]": second.id, "scavenger_hunts[1][title]": "Renamed",
+            "scavenger_hunts[2][title]": "Brand new",
+        })
+        self.assertEqual(response.status_code, 200)
+        titles = list(self.venue.scavenger_hunts.order_by("id").values_list("id", "title"))
+        self.assertEqual(titles[:2], [(first.id, first.title), (second.id, "Renamed")])
+        self.assertEqual(titles[2][1], "Brand new")
+        self.assertFalse(ScavengerHunt.objects.filter(pk=third.pk).exists())
+        second_after = ScavengerHunt.objects.get(pk=second.pk)
+        self.assertGreater(second_after.update_at, second.update_at)
+        # Progress on the untouched hunt survives
+        self.assertTrue(UserScavengerHunt.objects.filter(scavenger_hunt=first, checked=True).exists())
+        # One bulk UPDATE and one INSERT for the hunts
+        table = ScavengerHunt._meta.db_table
+        self.assertEqual(statements.count(f'UPDATE "{table}" SET'), 1)
+        self.assertEqual(statements.count(f'INSERT INTO "{table}"'), 1)
+
+    def test_unknown_id_is_rejected(self):
+        other = make_catalog(1, suffix="other-")[0].stops.first()
+        response, _ = self.patch({"stops[0][id]": other.id, "stops[0][name]": "Moved"})
+        self.assertEqual(response.status_code, 400)
+        other.refresh_from_db()
+        self.assertEqual(other.name, "Stop")
+
+
+class CatalogImportTests(TestCase):
+    CSV = (
+        "record,venue_name,city,type_of_place,name,title,message,latitude,longitude\n"
+        "venue,Lalbagh Fort,Dhaka,Fort,,,,23.71,90.38\n"
+        "stop,Lalbagh Fort,,,South gate,,,23.71,90.38\n"
+        "hunt,Lalbagh Fort,,,,Tomb,,23.72,90.39\n"
+        "message,Lalbagh Fort,,,,,Welcome,,\n"
+        "stop,Unknown venue,,,Gate,,,23.7,90.3\n"
+        "venue,Ahsan Manzil,Dhaka,Palace,,,,north,90.4\n"
+    )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = CustomUser.objects.create_user("admin@example.com", "Admin", "0100", password="x")
+        self.admin.is_staff = True
+        self.admin.save()
+
+    def upload(self, body, name="catalog.csv"):
+        self.client.force_authenticate(self.admin)
+        return self.client.post("/api/services/import/", {"file": SimpleUploadedFile(name, body.encode())}, format="multipart")
+
+    def test_import_is_an_upsert(self):
+        response = self.upload(self.CSV)
+        self.assertEqual(response.status_code, 200)
+        report = response.json()
+        self.assertEqual(report["created"], {"venues": 1, "stops": 1, "scavenger_hunts": 1, "messages": 1})
+        self.assertCountEqual([error["row"] for error in report["errors"]], [6, 7])
+        venue = Venue.objects.get(venue_name="Lalbagh Fort")
+        self.assertEqual((venue.city.name, venue.type_of_place.name), ("Dhaka", "Fort"))
+        stamp = venue.update_at
+
+        # Unchanged rows are not written again
+        report = self.upload(self.CSV.replace("Tomb,,23.72", "Tomb,,23.73")).json()
+        self.assertEqual(report["created"], {"venues": 0, "stops": 0, "scavenger_hunts": 0, "messages": 0})
+        self.assertEqual(report["updated"], {"venues": 0, "stops": 0, "scavenger_hunts": 1, "messages": 0})
+        venue.refresh_from_db()
+        self.assertEqual(venue.update_at, stamp)
+        self.assertEqual(venue.scavenger_hunts.get().latitude, 23.73)
+
+    def test_bad_coordinates_are_row_errors(self):
+        body = self.CSV.splitlines()[0] + "\n" + "\n".join([
+            "venue,Nan fort,Dhaka,Fort,,,,nan,90.38",
+            "venue,Far fort,Dhaka,Fort,,,,23.71,190",
+            "venue,Lalbagh Fort,Dhaka,Fort,,,,23.71,90.38",
+        ])
+        report = self.upload(body).json()
+        self.assertEqual([error["row"] for error in report["errors"]], [2, 3])
+        self.assertEqual(report["created"]["venues"], 1)
+
+    def test_rolled_back_batch_forgets_its_ids(self):
+        class FailingImporter(CatalogImporter):
+            def import_batch(self, batch):
+                with transaction.atomic():
+                    super().import_batch(batch)
+                    if batch[0][1]["venue_name"] == "First":
+                        raise IntegrityError("rejected")
+
+        rows = [
+            (1, {"venue_name": "First", "city": "Sylhet", "type_of_place": "Park", "latitude": 24.9, "longitude": 91.8}),
+            (2, {"venue_name": "Second", "city": "Sylhet", "type_of_place": "Park", "latitude": 24.9, "longitude": 91.9}),
+        ]
+        report = FailingImporter(batch_size=1).run(rows)
+        self.assertEqual(report["created"]["venues"], 1)
+        self.assertEqual(report["errors"][0]["row"], 1)
+        # The second batch created Sylhet again instead of pointing at the rolled-back row
+        self.assertEqual(Venue.objects.get().city.name, "Sylhet")
+        self.assertFalse(Venue.objects.filter(venue_name="First").exists())
+
+    def test_geojson_features_in_batches(self):
+        features = [
+            {"type": "Feature", "geometry": {"type": "Point", "coordinates": [90.4, 23.8 + i / 100]},
+             "properties": {"venue_name": f"Venue {i}", "city": "Dhaka", "type_of_place": "Museum"}}
+            for i in range(5)
+        ]
+        body = json.dumps({"type": "FeatureCollection", "features": features})
+        self.client.force_authenticate(self.admin)
+        response = self.client.post(
+            "/api/services/import/",
+            {"file": SimpleUploadedFile("catalog.geojson", body.encode()), "batch_size": 2},
+            format="multipart",
+        )
+        self.assertEqual(response.json()["created"]["venues"], 5)
+        self.assertAlmostEqual(Venue.objects.get(venue_name="Venue 3").latitude, 23.83)
+
+    def test_admin_only(self):
+        self.admin.is_staff = False
+        self.admin.save()
+        self.assertEqual(self.upload(self.CSV).status_code, 403)
+        self.assertFalse(Venue.objects.exists())
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        settings = override_settings(MEDIA_ROOT=self.media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def photo(self, size=(2000, 1000)):
+        body = BytesIO()
+        Image.new("RGB", size, "red").save(body, "JPEG")
+        return SimpleUploadedFile("photo.jpg", body.getvalue(), content_type="image/jpeg")
+
+    def test_upload_queues_downscaled_derivatives(self):
+        def queued(callbacks):
+            return [callback for callback in callbacks if callback.__qualname__.startswith("schedule_derivatives")]
+
+        venue = make_catalog(1, hunts_per_venue=0)[0]
+        with self.captureOnCommitCallbacks() as callbacks:
+            venue.save()
+        self.assertEqual(queued(callbacks), [])
+
+        venue.image = self.photo()
+        with self.captureOnCommitCallbacks() as callbacks:
+            venue.save()
+        self.assertEqual(len(queued(callbacks)), 1)
+
+        written = build_derivatives(venue.image.name)
+        self.assertEqual(len(written), len(DERIVATIVE_SIZES) * len(DERIVATIVE_FORMATS))
+        with Image.open(f"{self.media}/{derivative_name(venue.image.name, 'thumb', 'webp')}") as thumb:
+            self.assertEqual((thumb.format, thumb.size), ("WEBP", (320, 320)))
+        with Image.open(f"{self.media}/{derivative_name(venue.image.name, 'medium', 'jpeg')}") as medium:
+            self.assertEqual((medium.format, medium.size), ("JPEG", (1024, 512)))
+        self.assertEqual(build_derivatives(venue.image.name), [])
+
+        client = APIClient()
+        client.force_authenticate(CustomUser.objects.create_user("user@example.com", "User", "0100", password="x"))
+        body = client.get(f"/api/services/venues/{venue.id}/").json()
+        self.assertTrue(body["image_derivatives"]["thumb"]["webp"].endswith(".thumb.webp"))
+
+    def test_small_images_are_not_upscaled(self):
+        hunt = ScavengerHunt.objects.create(
+            venue=make_catalog(1, hunts_per_venue=0)[0], title="Hunt", latitude=23.8, longitude=90.4,
+            image=self.photo((200, 100)),
+        )
+        build_derivatives(hunt.image.name)
+        with Image.open(f"{self.media}/{derivative_name(hunt.image.name, 'thumb', 'jpeg')}") as thumb:
+            self.assertEqual(thumb.size, (100, 100))
@@ -21,6 +21,8 @@ urlpatterns = [
     path("user-scavenger-hunts/<int:pk>/", UserScavengerHuntUpdateView.as_view(), name="user-scavenger-hunt-update"),
     # GeoFencedViews
     path('geofences/', GeoFencedViews.as_view(), name='geofence-list'),
+    path('geofences/check/', GeoFenceCheckView.as_view(), name='geofence-check'),
+    path('geofences/events/', GeoFenceEventsView.as_view(), name='geofence-events'),
     path('geofences/<int:pk>/', GeoFencedDetailView.as_view(), name='geofence-detail'),
     # for venue messages
     path('venues/message/create/', CreateVenueMessageView.as_view(), name='create-venue-message'),
@@ -33,4 +35,11 @@ urlpatterns = [
     # for nearby attractions
     path('nearby-attractions/', NearByAttractionView.as_view(), name='nearby-attraction'),
     path('nearby-attractions/<int:pk>/', NearByAttractionDetailView.as_view(), name='nearby-attraction-detail'),
+
+    # offline catalog delta sync
+    path('sync/', CatalogSyncView.as_view(), name='catalog-sync'),
+    path('sync/bundle/', CatalogBundleView.as_view(), name='catalog-bundle'),
+
+    # bulk catalog import
+    path('import/', CatalogImportView.as_view(), name='catalog-import'),
 ]
@@ -1,11 +1,54 @@
 import math
 
+import numpy as np
+
+EARTH_RADIUS_KM = 6371
+
+
 def haversine(lat1, lon1, lat2, lon2):
-    R = 6371  # Earth radius in km
+    R = EARTH_RADIUS_KM  # Earth radius in km
     phi1, phi2 = math.radians(lat1), math.radians(lat2)
     dphi = math.radians(lat2 - lat1)
     dlambda = math.radians(lon2 - lon1)
 
     a = math.sin(dphi/2)**2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda/2)**2
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return R * c
\ No newline at end of file
+    return R * c
+
+
+def is_coordinate(lat, lon):
+    """True for a finite latitude/longitude pair within the globe's ranges."""
+    return math.isfinite(lat) and math.isfinite(lon) and abs(lat) <= 90 and abs(lon) <= 180
+
+
+def haversine_many(lat, lon, lats, lons):
+    """
+    Vectorized haversine distance in km.
+
+    `lat`/`lon` may be a single point or arrays of query points; `lats`/`lons`
+    are the target coordinates. A single query returns shape (n,), q queries
+    return shape (q, n).
+    """
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lons = np.radians(np.asarray(lons, dtype=np.float64))
+    if lat.ndim:
+        lat, lon = lat[:, None], lon[:, None]
+
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def k_smallest(distances, k):
+    """Indices of the k smallest distances (along the last axis), closest first."""
+    n = distances.shape[-1]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(distances.shape[:-1] + (0,), dtype=np.intp)
+    if k < n:
+        idx = np.argpartition(distances, k - 1, axis=-1)[..., :k]
+    else:
+        idx = np.broadcast_to(np.arange(n), distances.shape).copy()
+    order = np.argsort(np.take_along_axis(distances, idx, axis=-1), axis=-1, kind="stable")
+    return np.take_along_axis(idx, order, axis=-1)
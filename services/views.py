@@ -1,20 +1,37 @@
 from traitlets import Any
 from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.exceptions import ValidationError
 from rest_framework import generics, status, permissions
 from rest_framework.response import Response
 from .models import *
 from .serializers import *
 from rest_framework.views import APIView
 from rest_framework import status
-from .utils import haversine
+from .bundle import schedule_bundle_build
+from .cache import cache_response
+from .conditional import ConditionalGetMixin
+from .spatial import nearest_venues, with_distance
+from .utils import is_coordinate
+from .sync import changes_since, decode_cursor
+from .importer import DEFAULT_BATCH_SIZE, CatalogImporter, read_catalog
+from .geofence import PRECISION_LEVELS, get_geofence_index, get_snapshot
 from django.shortcuts import get_object_or_404
+from django.db.models import Prefetch
+from project.pagination import KeysetPagination
+from django.http import HttpResponse
+from django.utils.http import parse_etags
+import csv
+import gzip
+import io
 
 
-class CityView(generics.ListCreateAPIView):
+class CityView(ConditionalGetMixin, generics.ListCreateAPIView):
+      queryset = City.objects.all()
       serializer_class = CitySerializer
       permission_classes = [permissions.AllowAny]
 
 
+      @cache_response(City)
       def get(self, request, *args, **kwargs):
           cities = City.objects.all()
           serializer = self.get_serializer(cities, many=True)
@@ -70,26 +87,59 @@ class PlaceTypeDetailView(generics.RetrieveUpdateDestroyAPIView):
     lookup_field = 'pk'
     
     
-class CreateVenueMessageView(generics.ListCreateAPIView):
+class CreateVenueMessageView(ConditionalGetMixin, generics.ListCreateAPIView):
     serializer_class = CreateVenueMessageSerializer
     queryset = List_Message.objects.all()
 
-class VenueMessageDetailView(generics.ListAPIView):
+class VenueMessageDetailView(ConditionalGetMixin, generics.ListAPIView):
     serializer_class = VenueMessageSerializer
     
     def get_queryset(self):
         venue_id = self.kwargs.get("venue_id")
         return List_Message.objects.filter(venue_id=venue_id)
 
-class VenueCreateListView(generics.ListCreateAPIView):
+class VenueConditionalGetMixin(ConditionalGetMixin):
+    # relation -> serializer fields that render it (hunts also decide is_premium and stops)
+    rendered_relations = {
+        "city": ("city",),
+        "type_of_place": ("type_of_place",),
+        "scavenger_hunts": ("scavenger_hunts", "is_premium", "stops"),
+        "stops": ("stops",),
+        "messages": ("venue_message",),
+    }
+
+    def get_conditional_related(self):
+        fields = self.get_serializer_class().requested_fields(self.request)
+        return [
+            relation for relation, rendered_by in self.rendered_relations.items()
+            if fields is None or fields.intersection(rendered_by)
+        ]
+
+    def get_conditional_querysets(self):
+        querysets = super().get_conditional_querysets()
+        if self.request.user.is_authenticated and "scavenger_hunts" in self.get_conditional_related():
+            # nested hunts carry the user's progress
+            querysets.append(UserScavengerHunt.objects.filter(
+                user=self.request.user, scavenger_hunt__venue__in=querysets[0].order_by().values("pk")
+            ))
+        return querysets
+
+
+class VenueCreateListView(VenueConditionalGetMixin, generics.ListCreateAPIView):
     serializer_class = VenueSerializer
     permission_classes = [permissions.AllowAny]
     parser_classes = [MultiPartParser, FormParser]
+    query_budget = 7
 
+    def get_queryset(self):
+        # ?lat=&lon= sorts by distance in the database; ?fields=/?expand= trim the prefetches
+        fields = VenueSerializer.requested_fields(self.request)
+        return with_distance(Venue.objects.with_details(fields), self.request)
+
+    # hunts carry the user's progress, so only anonymous responses are shared
+    @cache_response(Venue, City, PlaceType, ScavengerHunt, Stops, List_Message, anonymous_only=True)
     def get(self, request, *args, **kwargs):
-        venues = Venue.objects.all()
-        serializer = self.get_serializer(venues, many=True)
-        return Response(serializer.data)
+        return self.list(request, *args, **kwargs)
 
     def post(self, request, *args, **kwargs):
         if not request.user.is_superuser:
@@ -101,15 +151,17 @@ class VenueCreateListView(generics.ListCreateAPIView):
             return Response(self.get_serializer(venue).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class VenueAdminCreateListView(generics.ListCreateAPIView):
+class VenueAdminCreateListView(VenueConditionalGetMixin, generics.ListCreateAPIView):
     serializer_class = VenueAdminSerializer
     permission_classes = [permissions.AllowAny]
     parser_classes = [MultiPartParser, FormParser]
+    query_budget = 6
+
+    def get_queryset(self):
+        return Venue.objects.with_details(VenueAdminSerializer.requested_fields(self.request))
 
     def get(self, request, *args, **kwargs):
-        venues = Venue.objects.all()
-        serializer = self.get_serializer(venues, many=True)
-        return Response(serializer.data)
+        return self.list(request, *args, **kwargs)
 
     def post(self, request, *args, **kwargs):
         if not request.user.is_superuser:
@@ -167,32 +219,49 @@ class VenueUpdateView(generics.RetrieveUpdateAPIView):
 class VenueDetailView(generics.RetrieveUpdateDestroyAPIView):
     queryset = Venue.objects.all()
     serializer_class = VenueSerializer
+    query_budget = 5
+
+    def get_queryset(self):
+        if self.request.method == "GET":
+            return Venue.objects.with_details(VenueSerializer.requested_fields(self.request))
+        return super().get_queryset()
   
   
-class VenueByCityView(generics.ListAPIView):
+class VenueByCityView(VenueConditionalGetMixin, generics.ListAPIView):
     serializer_class = VenueSerializer
     permission_classes = [permissions.AllowAny]
+    query_budget = 7
 
     def get_queryset(self):
         city_id = self.kwargs['city_id']
-        return Venue.objects.filter(city_id=city_id)
-
-    def get(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        # ?lat=&lon= sorts by distance in the database
+        fields = VenueSerializer.requested_fields(self.request)
+        return with_distance(Venue.objects.with_details(fields).filter(city_id=city_id), self.request)
 
 
 class PlaceWiseVenueView(APIView):
     serializer_class = PlaceWiseVenueSerializer
     permission_classes = [permissions.AllowAny]
 
+    query_budget = 6
+
+    @cache_response(Venue, City, PlaceType, ScavengerHunt, Stops, List_Message, anonymous_only=True)
     def get(self, request):
         data = {}
-        categories = PlaceType.objects.prefetch_related("venues").all()
-        for category in categories:
-            venues = category.venues.all()[:5]  # limit to 5 venues
-            data[category.name] = VenueSerializer(venues, many=True).data
+        # limit to 5 venues per category, ranked in a single query
+        fields = VenueSerializer.requested_fields(request)
+        top_venues = Venue.objects.with_details(fields).top_per_group("type_of_place", 5)
+        categories = PlaceType.objects.prefetch_related(
+            Prefetch("venues", queryset=top_venues, to_attr="top_venues")
+        )
+        grouped = {category.name: category.top_venues for category in categories}
+
+        # One progress lookup shared by every category's hunts
+        context = {"request": request}
+        if fields is None or "scavenger_hunts" in fields:
+            load_hunt_progress(context, [venue for venues in grouped.values() for venue in venues])
+        for name, venues in grouped.items():
+            data[name] = VenueSerializer(venues, many=True, context=context).data
         return Response(data)
 
 
@@ -217,19 +286,103 @@ class UserScavengerHuntUpdateView(generics.UpdateAPIView):
     
 
 class GeoFencedViews(generics.ListCreateAPIView):
-    queryset = GeoFenced.objects.all()
+    queryset = GeoFenced.objects.prefetch_related("polygon_points")
     serializer_class = GeoFencedSerializer
     permission_classes = [permissions.AllowAny]
 
+    def get_precision(self):
+        precision = self.request.query_params.get("precision", "full")
+        if precision != "full" and precision not in PRECISION_LEVELS:
+            raise ValidationError({"error": f"precision must be one of: full, {', '.join(PRECISION_LEVELS)}"})
+        return precision
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["precision"] = self.get_precision()
+        return context
+
+    def perform_authentication(self, request):
+        # The list is the same for everyone, skip the user lookup on reads
+        if request.method != "GET":
+            super().perform_authentication(request)
+
+    def get(self, request, *args, **kwargs):
+        # Served from the compiled snapshot: no queries or serialization unless
+        # a geofence changed since it was built
+        precision = self.get_precision()
+        snapshot = get_snapshot()
+        etag = f'"geofences-{snapshot["version"]}-{precision}"'
+
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            body = snapshot["payloads"][precision]
+            if "gzip" in request.headers.get("Accept-Encoding", ""):
+                response = HttpResponse(body, content_type="application/json")
+                response["Content-Encoding"] = "gzip"
+            else:
+                response = HttpResponse(gzip.decompress(body), content_type="application/json")
+        response["ETag"] = etag
+        response["Vary"] = "Accept-Encoding"
+        return response
+
     def perform_create(self, serializer):
         if not self.request.user.is_superuser:
             raise PermissionError("Only superusers can create geofences.")
         serializer.save()
 
 class GeoFencedDetailView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = GeoFenced.objects.all()
+    queryset = GeoFenced.objects.prefetch_related("polygon_points")
     serializer_class = GeoFencedSerializer
 
+
+class GeoFenceCheckView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        try:
+            lat = float(request.query_params.get("lat"))
+            lon = float(request.query_params.get("lon"))
+            if not is_coordinate(lat, lon):
+                raise ValueError
+        except (TypeError, ValueError):
+            return Response({"error": "lat and lon query parameters are required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        fences = get_geofence_index().containing(lat, lon)
+        return Response({
+            "inside": bool(fences),
+            "geofences": GeoFenceCheckSerializer(fences, many=True).data,
+        }, status=status.HTTP_200_OK)
+
+
+class GeoFenceEventsView(APIView):
+    """Turn an ordered batch of location pings into geofence enter/exit events."""
+
+    def post(self, request):
+        serializer = GeoFenceEventsSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        pings = sorted(serializer.validated_data["pings"], key=lambda p: p["timestamp"])
+        events, inside = get_geofence_index().transitions(
+            [p["latitude"] for p in pings],
+            [p["longitude"] for p in pings],
+            initial=serializer.validated_data["inside"],
+        )
+        return Response({
+            "events": [
+                {
+                    "event": kind,
+                    "timestamp": pings[i]["timestamp"],
+                    "latitude": pings[i]["latitude"],
+                    "longitude": pings[i]["longitude"],
+                    "geofence": GeoFenceCheckSerializer(fence).data,
+                }
+                for i, fence, kind in events
+            ],
+            "inside": sorted(inside),
+        }, status=status.HTTP_200_OK)
+
 class NearestVenueView(APIView):
     permission_classes = [permissions.AllowAny]
 
@@ -237,18 +390,18 @@ class NearestVenueView(APIView):
         try:
             user_lat = float(request.query_params.get("lat"))
             user_lon = float(request.query_params.get("lon"))
+            if not is_coordinate(user_lat, user_lon):
+                raise ValueError
         except (TypeError, ValueError):
             return Response(
                 {"error": "lat and lon query parameters are required"},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        venues = Venue.objects.select_related('city').all()
-        venue_list = []
-
-        for v in venues:
-            distance = haversine(user_lat, user_lon, v.latitude, v.longitude)
-            venue_list.append({
+        # Nearest 2 venues, ordered by distance
+        nearest = []
+        for v, distance in nearest_venues(user_lat, user_lon, 2):
+            nearest.append({
                 "id": v.id,
                 "city": v.city.name if v.city else None,
                 "venue_name": v.venue_name,
@@ -258,18 +411,8 @@ class NearestVenueView(APIView):
                 "distance_km": round(distance, 2),
             })
 
-        # Sort by distance only
-        sorted_list = sorted(venue_list, key=lambda x: x["distance_km"])
-
-        # Take nearest 2 venues after sorting by distance
-        nearest = sorted_list[:2]
-
-        # Get city name for the closest venue
-        city_name = None
-        if nearest:
-            first_city = Venue.objects.filter(id=nearest[0]["id"]).select_related('city').first()
-            if first_city and first_city.city:
-                city_name = first_city.city.name
+        # City name of the closest venue
+        city_name = nearest[0]["city"] if nearest else None
 
         return Response({
             "city": city_name,
@@ -283,15 +426,15 @@ class NearestVenueTenView(APIView):
         try:
             user_lat = float(request.query_params.get("lat"))
             user_lon = float(request.query_params.get("lon"))
+            if not is_coordinate(user_lat, user_lon):
+                raise ValueError
         except (TypeError, ValueError):
             return Response({"error": "lat and lon query parameters are required"}, status=status.HTTP_400_BAD_REQUEST)
 
-        venues = Venue.objects.all()
-
-        venue_list = []
-        for v in venues:
-            distance = haversine(user_lat, user_lon, v.latitude, v.longitude)
-            venue_list.append({
+        # Nearest 10 venues, ordered by distance
+        nearest = []
+        for v, distance in nearest_venues(user_lat, user_lon, 10):
+            nearest.append({
                 "id": v.id,
                 "city": v.city_id,
                 "venue_name": v.venue_name,
@@ -301,20 +444,84 @@ class NearestVenueTenView(APIView):
                 "distance_km": round(distance, 2),
             })
 
-        # Sort by distance and get nearest 10
-        nearest = sorted(venue_list, key=lambda x: x["distance_km"])[:10]
-
         return Response(nearest, status=status.HTTP_200_OK)
 
 
 
 class CityVenuesAPIView(APIView):
+    query_budget = 2
+
+    @cache_response(City, Venue)
     def get(self, request):
-        cities = City.objects.all()
-        serializer = CityByVenueSerializer(cities, many=True)
-        return Response(serializer.data)
+        # First 2 venues of every city, ranked in a single query
+        cities = City.objects.prefetch_related(
+            Prefetch("venues", queryset=Venue.objects.top_per_group("city", 2), to_attr="top_venues")
+        )
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(cities, request, view=self)
+        serializer = CityByVenueSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
     
     
+class CatalogSyncView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        # ?since= is the cursor of the previous sync; without it everything is sent
+        since = decode_cursor(request.query_params.get("since"))
+        changed, deleted, cursor = changes_since(since)
+
+        context = {"request": request}
+        data = {"cursor": cursor}
+        for key, queryset in changed.items():
+            data[key] = SYNC_SERIALIZERS[key](queryset, many=True, context=context).data
+        data["deleted"] = deleted
+        return Response(data)
+
+
+class CatalogBundleView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        bundle = CatalogBundle.objects.order_by("-version").first()
+        if bundle is None:
+            schedule_bundle_build()
+            return Response({"error": "The catalog bundle is being built, try again later."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            "version": bundle.version,
+            "url": request.build_absolute_uri(bundle.file.url),
+            "size": bundle.size,
+            "sha256": bundle.sha256,
+            "created_at": bundle.create_at,
+        })
+
+
+class CatalogImportView(APIView):
+    """Upsert venues, stops, hunts and messages from an uploaded CSV or GeoJSON file."""
+    permission_classes = [permissions.IsAdminUser]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request, *args, **kwargs):
+        upload = request.FILES.get("file")
+        if upload is None:
+            return Response({"error": "Upload the catalog as file"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            batch_size = int(request.data.get("batch_size", DEFAULT_BATCH_SIZE))
+        except (TypeError, ValueError):
+            return Response({"error": "batch_size must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+
+        importer = CatalogImporter(batch_size)
+        try:
+            importer.run(read_catalog(io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline=""), upload.name))
+        except (ValueError, csv.Error) as error:
+            # Batches before the unreadable part are already committed
+            return Response(
+                {"error": f"Could not read the file: {error}", **importer.report},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(importer.report, status=status.HTTP_200_OK)
+
+
 class CreateStopView(generics.CreateAPIView):
     serializer_class = CreateStopSerializer
     permission_classes = [permissions.IsAdminUser]
@@ -327,21 +534,33 @@ class CreateStopView(generics.CreateAPIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     
-class ListStopView(generics.ListAPIView):
+class ListStopView(ConditionalGetMixin, generics.ListAPIView):
     serializer_class = ListStopSerializer
+    conditional_related = ("stops",)
     permission_classes = [permissions.AllowAny]
     
     def get_queryset(self):
         return Venue.objects.prefetch_related('stops').filter(stops__isnull=False).distinct()
 
+    @cache_response(Venue, Stops)
+    def get(self, request, *args, **kwargs):
+        return self.list(request, *args, **kwargs)
 
-class NearByAttractionView(generics.ListCreateAPIView):
-    queryset = NearByAttraction.objects.all()
+
+class NearByAttractionView(ConditionalGetMixin, generics.ListCreateAPIView):
     serializer_class = NearByAttractionSerializer
     permission_classes = [permissions.AllowAny]
     # use formdata and multipart parsers
     parser_classes = [MultiPartParser, FormParser]
 
+    def get_queryset(self):
+        # ?lat=&lon= sorts by distance in the database
+        return with_distance(NearByAttraction.objects.all(), self.request)
+
+    @cache_response(NearByAttraction)
+    def get(self, request, *args, **kwargs):
+        return self.list(request, *args, **kwargs)
+
 class NearByAttractionDetailView(generics.RetrieveUpdateDestroyAPIView):
     queryset = NearByAttraction.objects.all()
     serializer_class = NearByAttractionSerializer